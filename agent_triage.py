@@ -1,84 +1,258 @@
 import os
 import sys
-import json
-import subprocess
-import re
+import time
+import argparse
+from bisect import bisect_left
+
+import llm_client
+import metrics
+import scanlist
+import telemetry
+import zone_prompt
 
 # Logic:
-# 1. Ingest scan_list.txt
+# 1. Ingest scan_list.txt (or the binary scan_list.qsl)
 # 2. Extract Folders.
 # 3. AI STEP 1: Analyze Folders.
 # 4. AI STEP 2: Analyze Files in Sus Folders.
-# 5. Output suspicious_targets.txt
+# 5. Output suspicious_targets.txt / .qsl (and the high-risk zones, for watch.py)
 
 API_KEY = os.getenv("OPENROUTER_KEY")
 MODEL = "google/gemini-2.0-flash-exp:free"
 
-def call_llm(prompt):
-    if not API_KEY or API_KEY == "test":
-        return None # Trigger Fallback
+ZONES_FILE = "high_risk_zones.txt"
 
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": "You are a Cyber Sentinel. Return ONLY items from the list that are suspicious/dangerous. Raw text, one per line."},
-            {"role": "user", "content": prompt}
-        ]
-    }
-    
+# Routine folders filtered out to save context
+ROUTINE_ZONES = ["/proc", "/sys", "/snap", "/var/lib", "/usr/share"]
+
+def is_routine_zone(folder):
+    return any(x in folder for x in ROUTINE_ZONES)
+
+def heuristic_zone(folder):
+    # FALLBACK HEURISTICS (Agentic Intuition)
+    return "Desktop" in folder or "tmp" in folder or "Downloads" in folder
+
+SYSTEM_PROMPT = "You are a Cyber Sentinel. Return ONLY items from the list that are suspicious/dangerous. Raw text, one per line."
+
+def save_zones(hot, seen, path=ZONES_FILE):
+    """
+    Merge this run's high-risk zones into the zones file. Incremental runs
+    only see changed folders, so earlier zones that were not re-triaged
+    stay listed while they still exist; zones seen this run and not
+    flagged are dropped. Written atomically for watch.py.
+    """
+    hot = list(dict.fromkeys(hot))
+    seen = set(seen) | set(hot)
     try:
-        # Write payload to temp file to avoid CLI limits
-        with open("llm_req.json", "w") as f:
-            json.dump(payload, f)
-            
-        cmd = f'curl -s -X POST https://openrouter.ai/api/v1/chat/completions -H "Authorization: Bearer {API_KEY}" -H "Content-Type: application/json" -d @llm_req.json'
-        result = subprocess.check_output(cmd, shell=True)
-        data = json.loads(result)
-        if "choices" in data:
-            return data["choices"][0]["message"]["content"]
-    except Exception as e:
-        return None
-    return None
-
-def main():
+        with open(path) as f:
+            old = [line.strip() for line in f]
+    except OSError:
+        old = []
+    kept = [z for z in dict.fromkeys(old) if z and z not in seen and os.path.isdir(z)]
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        for z in hot + kept:
+            f.write(z + "\n")
+    os.replace(tmp, path)
+    return len(kept)
+
+def llm_available():
+    return bool(API_KEY) and API_KEY != "test"
+
+def build_messages(prompt, system=SYSTEM_PROMPT):
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt}
+    ]
+
+def call_llm(prompt, model=MODEL, system=SYSTEM_PROMPT, metric="triage.call_llm"):
+    # metric names the caller's latency series (deep_scan passes its own)
+    if not llm_available():
+        return None # Trigger Fallback
+
+    messages = build_messages(prompt, system)
+
+    with metrics.timer(metric):
+        try:
+            # Shared keep-alive client: no curl fork or temp file per request
+            return llm_client.shared_client(API_KEY).chat_sync(messages, model)
+        except Exception as e:
+            metrics.count(metric + "_failed")
+            return None
+
+# Zone triage is split into prompts of at most this many (estimated) tokens.
+# Zones go out as a tagged tree (zone_prompt.py), which fits many more per prompt.
+TRIAGE_PROMPT = ("Analyze these folders for user-writable or suspicious locations (e.g. Desktop, tmp, shm).\n"
+                 + zone_prompt.TREE_HINT + "\n")
+CHUNK_TOKEN_BUDGET = 3000
+TRIAGE_CONCURRENCY = 16
+
+def chunk_zones(folders, budget=CHUNK_TOKEN_BUDGET, encoded=True):
+    # Tree-ordered chunks; encoded=False budgets one full path per line instead
+    zones = sorted(folders, key=zone_prompt.zone_key)
+    chunks, i = [], 0
+    while i < len(zones):
+        j, used, prev = i, 0, ""
+        while j < len(zones):
+            f = zones[j]
+            cost = zone_prompt.zone_cost(prev, f) if encoded else zone_prompt.count_tokens(f) + 1
+            if j > i and used + cost > budget:
+                break
+            used += cost
+            prev = f
+            j += 1
+        # Per-zone costs miss indentation and shared parent lines: shrink to the real size
+        while encoded and j - i > 1:
+            actual = zone_prompt.count_tokens(zone_prompt.encode(zones[i:j])[0])
+            if actual <= budget:
+                break
+            j = i + max(1, min(j - i - 1, int((j - i) * budget / actual)))
+        chunks.append(zones[i:j])
+        i = j
+    return chunks
+
+def triage_zones(folders, chunks=None):
+    """
+    Classifies every zone: chunks are sent to the LLM concurrently and each
+    reply is decoded against its own chunk's tags. A chunk whose request
+    fails (or returns nothing) falls back to the local heuristics alone.
+    Returns (high-risk zones in input order, number of fallback chunks).
+    """
+    if chunks is None:
+        chunks = chunk_zones(folders)
+    replies = [None] * len(chunks)
+
+    if llm_available() and chunks:
+        prompts = [zone_prompt.encode(c)[0] for c in chunks]
+        requests = [(build_messages(TRIAGE_PROMPT + p), MODEL) for p in prompts]
+        try:
+            client = llm_client.shared_client(API_KEY, max_concurrency=TRIAGE_CONCURRENCY)
+            with metrics.timer("triage.llm_batch"):
+                replies = client.chat_many_sync(requests)
+        except Exception:
+            pass
+
+    sus = set()
+    fallback = 0
+    for chunk, reply in zip(chunks, replies):
+        if reply:
+            sus.update(zone_prompt.decode(reply, zone_prompt.encode(chunk)[1]))
+        else:
+            fallback += 1
+            sus.update(f for f in chunk if heuristic_zone(f))
+
+    metrics.count("triage.chunks", len(chunks))
+    metrics.count("triage.fallback_chunks", fallback)
+    return [f for f in folders if f in sus], fallback
+
+class ZoneIndex:
+    """
+    Path-component prefix index over the discovered file list.
+    Files are kept sorted, so every zone maps to one contiguous slice:
+    [bisect(zone + "/"), bisect(zone + "0")) -- '0' sorts right after '/'.
+    Unlike str.startswith, "/tmp" never claims "/tmpfoo/x".
+    """
+
+    def __init__(self, files, zones=()):
+        self.files = sorted(set(files))
+        self.zones = set(z.rstrip("/") or "/" for z in zones)
+
+    def files_under(self, zone):
+        # All files below zone (any depth), in O(log n) + output size
+        base = zone.rstrip("/")
+        lo = bisect_left(self.files, base + "/")
+        hi = bisect_left(self.files, base + "0", lo)
+        return self.files[lo:hi]
+
+    def owner(self, path):
+        # Deepest registered zone containing path, O(path depth)
+        return self.owner_dir(os.path.dirname(path))
+
+    def owner_dir(self, d):
+        # Deepest registered zone that is d or one of its ancestors
+        while True:
+            if d in self.zones:
+                return d
+            parent = os.path.dirname(d)
+            if parent == d:
+                return None
+            d = parent
+
+    def zone_files(self, zone):
+        # Files whose deepest registered zone is zone
+        return [f for f in self.files_under(zone) if self.owner(f) == zone]
+
+class ScanListZones(ZoneIndex):
+    """
+    ZoneIndex over a binary scan list. Ownership is decided once per
+    directory from the list's sorted directory table, so only the files of
+    high-risk zones are ever decoded.
+    """
+
+    def __init__(self, sl, zones=()):
+        self.sl = sl
+        self.zones = set(z.rstrip("/") or "/" for z in zones)
+
+    def files_under(self, zone):
+        return self.sl.files_under(zone)
+
+    def zone_files(self, zone):
+        return [f for i in self.sl.subtree(zone) if self.owner_dir(self.sl.dirs[i]) == zone
+                for f in self.sl.dir_files(i)]
+
+def main(source="scan_list.txt", targets_out="suspicious_targets.txt"):
     print("[*] AGENT: Initializing Hierarchical Scan...")
+    metrics.start("triage")
+    t0 = time.perf_counter()
     
     try:
-        with open("scan_list.txt", "r") as f:
-            files = [line.strip() for line in f if line.strip()]
-    except:
-        return
+        if scanlist.is_scan_list(source):
+            # Binary list: zones come straight from its directory table
+            index = ScanListZones(scanlist.ScanList.load(source))
+            folders, n_files = list(index.sl.dirs), len(index.sl)
+        else:
+            with open(source, "r") as f:
+                index = ZoneIndex(line.strip() for line in f if line.strip())
+            folders, n_files = None, len(index.files)
+    except (OSError, ValueError) as e:
+        print(f"[-] AGENT: cannot read {source}: {getattr(e, 'strerror', None) or e}")
+        sys.exit(1)
 
     # 1. Cluster Folders
-    folders = sorted(list(set([os.path.dirname(f) for f in files])))
-    # Filter routine folders to save context
-    folders = [f for f in folders if not any(x in f for x in ["/proc", "/sys", "/snap", "/var/lib", "/usr/share"])]
+    with metrics.timer("triage.cluster"):
+        if folders is None:
+            folders = sorted(set(os.path.dirname(f) for f in index.files))
+        # Filter routine folders to save context
+        folders = [f for f in folders if not is_routine_zone(f)]
     
-    print(f"[*] AGENT: Analyzed {len(files)} files into {len(folders)} Context Zones.")
+    print(f"[*] AGENT: Analyzed {n_files} files into {len(folders)} Context Zones.")
     
-    # 2. AI Triage - Folders
+    # 2. AI Triage - Folders (all zones, in token-budgeted chunks)
     print("[*] AGENT: Querying Neural Ops for High-Risk Zones...")
-    sus_folders = []
-    
-    folder_str = "\n".join(folders[:150]) # Limit for context
-    response = call_llm(f"Analyze these folders for user-writable or suspicious locations (e.g. Desktop, tmp, shm):\n{folder_str}")
-    
-    if response:
-        sus_folders = [line.strip() for line in response.split('\n') if line.strip() in folders]
-    else:
-        # FALLBACK HEURISTICS (Agentic Intuition)
+    with metrics.timer("triage.zones"):
+        chunks = chunk_zones(folders)
+        sus_folders, fallback = triage_zones(folders, chunks)
+    n_chunks = len(chunks)
+
+    if fallback and fallback == n_chunks:
         print("[!] AGENT: Neural Link Unstable. Engaging Local Heuristics.")
-        sus_folders = [f for f in folders if "Desktop" in f or "tmp" in f or "Downloads" in f]
+    elif fallback:
+        print(f"[!] AGENT: {fallback}/{n_chunks} chunks fell back to Local Heuristics.")
 
     print(f"[*] AGENT: Isolated {len(sus_folders)} High-Risk Zones.")
     
     # 3. AI Triage - Files in Zones
+    # Nested high-risk zones would claim the same file twice; each file goes
+    # to its deepest owning zone only.
+    index.zones = set(sus_folders)
     targets = []
+    events = []
     for folder in sus_folders:
-        zone_files = [f for f in files if f.startswith(folder)]
+        zone_files = index.zone_files(folder)
         if not zone_files: continue
         
         print(f"    -> Inspecting Zone: {folder} ({len(zone_files)} objects)")
+        events.append(("triage", "zone", folder, len(zone_files), None))
         
         # In a real deep agent, we would ask LLM again here.
         # "Here are files in /home/justin/Desktop. Which are weird?"
@@ -87,11 +261,137 @@ def main():
         targets.extend(zone_files)
 
     # Write Output
-    with open("suspicious_targets.txt", "w") as f:
-        for t in targets:
-            f.write(t + "\n")
-            
+    for _ in scanlist.write_paths(targets, targets_out):
+        pass
+    save_zones(sus_folders, folders)
+
     print(f"[*] AGENT: Handoff complete. {len(targets)} vectors queued for Deep Analysis.")
 
+    events.append(("triage", "triage", "batch", len(folders),
+                   {"files": n_files, "high_risk": len(sus_folders), "targets": len(targets),
+                    "fallback_chunks": fallback, "chunks": n_chunks}))
+    dt = time.perf_counter() - t0
+    metrics.observe("stage.triage", dt)
+    metrics.count("triage.files", n_files)
+    metrics.count("triage.targets", len(targets))
+    events.append(("triage", "stage", "triage", dt, None))
+    telemetry.emit_many(events)
+
+def iter_paths(source):
+    # Line-by-line reader over a pipe ("-" = stdin) or a file (text or .qsl)
+    if source != "-":
+        yield from scanlist.read_paths(source)
+        return
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            yield line
+
+# Streaming triage sends newly seen zones to the LLM in batches of this many;
+# their files wait in memory until the batch is classified
+STREAM_BATCH_ZONES = 64
+
+def _classify_pending(pending, verdicts, stats):
+    # Classifies the buffered zones in one triage_zones() pass; yields the files of hot zones
+    chunks = chunk_zones(list(pending))
+    hot, fallback = triage_zones(list(pending), chunks)
+    hot = set(hot)
+    stats["chunks"] += len(chunks)
+    stats["fallback_chunks"] += fallback
+    for zone, files in pending.items():
+        verdicts[zone] = zone in hot
+        if zone in hot:
+            print(f"    -> High-Risk Zone: {zone}")
+            telemetry.emit("triage", "zone", zone)
+            yield from files
+    pending.clear()
+
+def stream_targets(paths, verdicts, stats, heuristics_only=False):
+    """
+    Yields the paths of high-risk zones. Each zone is classified once: with
+    heuristics_only right away, otherwise new zones are buffered and sent to
+    the LLM (heuristics as fallback) STREAM_BATCH_ZONES at a time.
+    """
+    pending = {}   # zone -> its files, awaiting the next LLM batch
+    for path in paths:
+        stats["files"] += 1
+        zone = os.path.dirname(path)
+        hot = verdicts.get(zone)
+        if hot is None:
+            if zone in pending:
+                pending[zone].append(path)
+                continue
+            if is_routine_zone(zone):
+                verdicts[zone] = False
+                continue
+            if not heuristics_only:
+                pending[zone] = [path]
+                if len(pending) >= STREAM_BATCH_ZONES:
+                    yield from _classify_pending(pending, verdicts, stats)
+                continue
+            hot = verdicts[zone] = heuristic_zone(zone)
+            if hot:
+                print(f"    -> High-Risk Zone: {zone}")
+                telemetry.emit("triage", "zone", zone)
+        if hot:
+            yield path
+    if pending:
+        yield from _classify_pending(pending, verdicts, stats)
+
+def stream_main(source="scan_list.txt", targets_out="suspicious_targets.txt", heuristics_only=False):
+    """
+    Streaming triage: paths are consumed one at a time (from a file, '-' for
+    stdin, or any iterable such as discovery.walk()) and zones are
+    classified as they are first seen, so targets reach targets_out while
+    discovery is still running (a .qsl is complete when the stream ends).
+    Memory grows with zones, plus the files of at most one pending batch.
+    """
+    mode = "Local Heuristics only" if heuristics_only else "Neural Ops in batches"
+    print(f"[*] AGENT: Initializing Streaming Scan ({mode})...")
+    metrics.start("triage")
+    t0 = time.perf_counter()
+    verdicts = {}
+    stats = {"files": 0, "chunks": 0, "fallback_chunks": 0}
+    n_targets = 0
+
+    try:
+        paths = iter_paths(source) if isinstance(source, str) else source
+        for _ in scanlist.write_paths(stream_targets(paths, verdicts, stats, heuristics_only), targets_out):
+            n_targets += 1
+    except (OSError, ValueError) as e:
+        print(f"[-] AGENT: stream failed: {getattr(e, 'strerror', None) or e}")
+        sys.exit(1)
+
+    if stats["fallback_chunks"]:
+        print(f"[!] AGENT: {stats['fallback_chunks']}/{stats['chunks']} chunks fell back to Local Heuristics.")
+    n_hot = sum(verdicts.values())
+    save_zones([z for z, hot in verdicts.items() if hot], verdicts)
+    print(f"[*] AGENT: Streamed {stats['files']} files through {len(verdicts)} Context Zones ({n_hot} High-Risk).")
+    print(f"[*] AGENT: Handoff complete. {n_targets} vectors queued for Deep Analysis.")
+
+    dt = time.perf_counter() - t0
+    metrics.observe("stage.triage", dt)
+    metrics.count("triage.files", stats["files"])
+    metrics.count("triage.targets", n_targets)
+    telemetry.emit_many([
+        ("triage", "triage", "stream", len(verdicts),
+         {"files": stats["files"], "high_risk": n_hot, "targets": n_targets,
+          "fallback_chunks": stats["fallback_chunks"], "chunks": stats["chunks"]}),
+        ("triage", "stage", "triage", dt, None),
+    ])
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Q-SAFE hierarchical triage agent")
+    parser.add_argument("--stream", nargs="?", const="scan_list.txt", metavar="SOURCE",
+                        help="streaming triage from a file or '-' for stdin")
+    parser.add_argument("--input", default="scan_list.txt", help="discovery output, text or .qsl")
+    parser.add_argument("--targets", default="suspicious_targets.txt",
+                        help="deep scan hand-off; written as .qsl when the name ends in .qsl")
+    parser.add_argument("--heuristics-only", action="store_true",
+                        help="with --stream: classify zones locally, never call the LLM")
+    args = parser.parse_args()
+
+    if args.stream:
+        stream_main(args.stream, args.targets, args.heuristics_only)
+    else:
+        main(args.input, args.targets)
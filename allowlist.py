@@ -0,0 +1,355 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import random
+import argparse
+import tempfile
+import subprocess
+from array import array
+
+from fileutil import temp_beside
+
+# allowlist.bin v2: open-addressed hash table consumed by qsafe_hook.
+#
+#   header (32 bytes, little-endian)
+#     magic    4s   "QSAL"
+#     version  u16  2
+#     flags    u16  bit 0: hash 0 is allowed (0 marks empty slots)
+#     count    u64  distinct hashes stored
+#     capacity u64  slots, power of two
+#     shift    u32  64 - log2(capacity)
+#     load     u32  count / capacity in permille (informational)
+#   slots    capacity x u64
+#
+# slot(h) = (h * GOLDEN) mod 2^64 >> shift (Fibonacci hashing), linear probing.
+# Must match qsafe_monitor.asm and qsafe_allowlist.h EXACTLY.
+# Legacy v1 files (u64 count + u64 array, no magic) are still readable.
+
+ALLOWLIST_FILE = "allowlist.bin"
+MAGIC = b"QSAL"
+VERSION = 2
+FLAG_HAS_ZERO = 0x1
+HEADER = struct.Struct("<4sHHQQII")
+GOLDEN = 0x9E3779B97F4A7C15
+MASK64 = 0xFFFFFFFFFFFFFFFF
+MAX_LOAD = 0.5
+MIN_CAPACITY = 8
+
+def slot_of(h, shift):
+    return ((h * GOLDEN) & MASK64) >> shift
+
+def build_table(hashes, max_load=MAX_LOAD):
+    """
+    Returns (flags, count, capacity, shift, slots) for a set of 64-bit hashes.
+    Capacity keeps the load factor at or below max_load so probe chains stay short.
+    """
+    keys = set(h & MASK64 for h in hashes)
+    flags = FLAG_HAS_ZERO if 0 in keys else 0
+    keys.discard(0)
+
+    capacity = MIN_CAPACITY
+    while len(keys) > capacity * max_load:
+        capacity *= 2
+    shift = 64 - (capacity.bit_length() - 1)
+    mask = capacity - 1
+
+    slots = array("Q", bytes(8 * capacity))
+    for h in keys:
+        i = slot_of(h, shift)
+        while slots[i]:
+            i = (i + 1) & mask
+        slots[i] = h
+
+    count = len(keys) + (1 if flags & FLAG_HAS_ZERO else 0)
+    return flags, count, capacity, shift, slots
+
+def encode(hashes, max_load=MAX_LOAD):
+    flags, count, capacity, shift, slots = build_table(hashes, max_load)
+    if sys.byteorder != "little":
+        slots.byteswap()
+    header = HEADER.pack(MAGIC, VERSION, flags, count, capacity, shift, count * 1000 // capacity)
+    return header + slots.tobytes()
+
+def write_allowlist(hashes, path=ALLOWLIST_FILE, max_load=MAX_LOAD):
+    data = encode(hashes, max_load)
+    fd, tmp = temp_beside(path)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+class AllowlistWriter:
+    """
+    Streams hashes straight into a v2 table mapped from the output file, so
+    memory stays bounded by the file's page cache, not by Python objects.
+    Capacity is sized for max_entries up front; duplicates are dropped on
+    insert. close() writes the header and shrinks an oversized table.
+    """
+
+    def __init__(self, path=ALLOWLIST_FILE, max_entries=1 << 20, max_load=MAX_LOAD):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_load = max_load
+        self.capacity = MIN_CAPACITY
+        while max_entries > self.capacity * max_load:
+            self.capacity *= 2
+        self.shift = 64 - (self.capacity.bit_length() - 1)
+        self.mask = self.capacity - 1
+        self.count = 0
+        self.flags = 0
+        self.full = False
+
+        fd, self._tmp = temp_beside(path)
+        self._f = os.fdopen(fd, "w+b")
+        self._f.truncate(HEADER.size + 8 * self.capacity)
+        self._map = mmap.mmap(self._f.fileno(), 0)
+        self._slots = memoryview(self._map)[HEADER.size:].cast("Q")
+        self._swap = sys.byteorder != "little"
+
+    def add(self, h):
+        # Returns False once max_entries distinct hashes are stored
+        if h == 0:
+            if not self.flags & FLAG_HAS_ZERO:
+                if self.count >= self.max_entries:
+                    self.full = True
+                    return False
+                self.flags |= FLAG_HAS_ZERO
+                self.count += 1
+            return True
+        raw = int.from_bytes(h.to_bytes(8, "little"), "big") if self._swap else h
+        slots = self._slots
+        i = ((h * GOLDEN) & MASK64) >> self.shift
+        while True:
+            s = slots[i]
+            if s == raw:
+                return True
+            if s == 0:
+                break
+            i = (i + 1) & self.mask
+        if self.count >= self.max_entries:
+            self.full = True
+            return False
+        slots[i] = raw
+        self.count += 1
+        return True
+
+    def close(self):
+        # Returns the final file size
+        capacity = MIN_CAPACITY
+        while self.count > capacity * self.max_load:
+            capacity *= 2
+        if capacity < self.capacity:
+            # Re-insert into a right-sized table, slot by slot
+            small = AllowlistWriter(self.path, self.count, self.max_load)
+            for s in self._slots:
+                if s:
+                    small.add(int.from_bytes(s.to_bytes(8, "little"), "big") if self._swap else s)
+            if self.flags & FLAG_HAS_ZERO:
+                small.add(0)
+            self._slots.release()
+            self._map.close()
+            self._f.close()
+            os.unlink(self._tmp)
+            return small.close()
+
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, VERSION, self.flags, self.count, self.capacity,
+                                              self.shift, self.count * 1000 // self.capacity)
+        self._slots.release()
+        self._map.flush()
+        self._map.close()
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return HEADER.size + 8 * self.capacity
+
+class Allowlist:
+    """
+    Reader/validator for allowlist.bin (v2 table or legacy v1 list).
+    Works on any buffer; load() maps the file read-only, so like the C
+    loader it opens in constant time and shares pages with the monitors.
+    Lookup follows the same probe sequence as qsafe_hook.
+    """
+
+    def __init__(self, data):
+        self._map = None
+        with memoryview(data) as view:
+            self._parse(view)
+
+    def _parse(self, view):
+        self.legacy = view[:4] != MAGIC
+        if self.legacy:
+            (n,) = struct.unpack_from("<Q", view)
+            if len(view) < 8 + 8 * n:
+                raise ValueError("truncated hash list")
+            self.version, self.flags = 1, 0
+            self.entries = self._u64(view[8:8 + 8 * n])
+            self.count = self.capacity = n
+            return
+
+        if len(view) < HEADER.size:
+            raise ValueError("truncated header")
+        magic, self.version, self.flags, self.count, self.capacity, self.shift, self.load = HEADER.unpack_from(view)
+        if self.version != VERSION:
+            raise ValueError(f"unsupported allowlist version {self.version}")
+        if self.capacity < 2 or self.capacity & (self.capacity - 1):
+            raise ValueError("capacity is not a power of two")
+        if self.shift != 64 - (self.capacity.bit_length() - 1):
+            raise ValueError("shift does not match capacity")
+        if self.count >= self.capacity:
+            raise ValueError("table has no empty slot; lookups would not terminate")
+        if len(view) < HEADER.size + 8 * self.capacity:
+            raise ValueError("truncated slot table")
+        self.slots = self._u64(view[HEADER.size:HEADER.size + 8 * self.capacity])
+
+    @staticmethod
+    def _u64(view):
+        # Zero-copy u64 view on little-endian hosts, byteswapped copy otherwise
+        if sys.byteorder == "little":
+            return view.cast("Q")
+        values = array("Q", view)
+        values.byteswap()
+        return values
+
+    @classmethod
+    def load(cls, path=ALLOWLIST_FILE):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                raise ValueError("empty file")
+            m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            al = cls(m)
+        except Exception:
+            m.close()
+            raise
+        al._map = m
+        return al
+
+    def close(self):
+        for name in ("entries", "slots"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, h):
+        if self.legacy:
+            return h in self.entries   # linear, as in the v1 hook
+        if h == 0:
+            return bool(self.flags & FLAG_HAS_ZERO)
+        mask = self.capacity - 1
+        i = slot_of(h, self.shift)
+        while True:
+            s = self.slots[i]
+            if s == h:
+                return True
+            if s == 0:
+                return False
+            i = (i + 1) & mask
+
+    def __iter__(self):
+        if self.legacy:
+            return iter(self.entries)
+        zero = [0] if self.flags & FLAG_HAS_ZERO else []
+        return iter(zero + [s for s in self.slots if s])
+
+    def validate(self):
+        # Header/slot consistency and reachability of every stored hash; returns max probe length
+        if self.legacy:
+            return 0
+        stored = [s for s in self.slots if s]
+        expected = self.count - (1 if self.flags & FLAG_HAS_ZERO else 0)
+        if len(stored) != expected:
+            raise ValueError(f"header count {self.count} != {len(stored)} stored slots")
+        if expected >= self.capacity:
+            raise ValueError("table has no empty slot; lookups would not terminate")
+        mask = self.capacity - 1
+        worst = 0
+        for i, h in enumerate(self.slots):
+            if not h:
+                continue
+            probe = (i - slot_of(h, self.shift)) & mask
+            for j in range(probe):
+                if not self.slots[(slot_of(h, self.shift) + j) & mask]:
+                    raise ValueError(f"hash {h:#x} unreachable (empty slot in probe chain)")
+            worst = max(worst, probe + 1)
+        return worst
+
+# --- hook latency benchmark (drives ./bench_hook, see Makefile) ---
+
+BENCH_DEPTH = 8
+
+def bench_path():
+    # Call-ID sequence the benchmark replays, and its rolling context hashes
+    ids = [0x1000 + i for i in range(1, BENCH_DEPTH + 1)]
+    h, hashes = 0, []
+    for i in ids:
+        h = ((h << 1) & MASK64) ^ i
+        hashes.append(h)
+    return ids, hashes
+
+def benchmark(sizes=(2, 16, 1024, 65536, 1 << 20), binary="./bench_hook"):
+    if not os.path.exists(binary):
+        print(f"[-] {binary} not built. Run: make bench_hook")
+        return
+    _, path_hashes = bench_path()
+    rng = random.Random(7)
+    print(f"[*] HOOK BENCH: valid path of up to {BENCH_DEPTH} calls, ns per qsafe_hook")
+    print(f"    {'entries':>8}  {'linear (v1)':>12}  {'table (v2)':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            depth = min(n, BENCH_DEPTH)
+            hashes = set(path_hashes[:depth])
+            while len(hashes) < n:
+                hashes.add(rng.getrandbits(64))
+            hashes = list(hashes)
+            rng.shuffle(hashes)
+            v1 = os.path.join(tmp, "v1.bin")
+            with open(v1, "wb") as f:
+                f.write(struct.pack(f"<Q{len(hashes)}Q", len(hashes), *hashes))
+            v2 = os.path.join(tmp, "v2.bin")
+            write_allowlist(hashes, v2)
+            row = []
+            for path in (v1, v2):
+                out = subprocess.run([binary, path, str(depth)], capture_output=True, text=True)
+                row.append(out.stdout.strip() if out.returncode == 0 else "fail")
+            print(f"    {n:>8}  {row[0]:>12}  {row[1]:>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE allowlist reader / validator")
+    parser.add_argument("path", nargs="?", default=ALLOWLIST_FILE)
+    parser.add_argument("--check", nargs="*", default=[], help="hashes (hex) to look up")
+    parser.add_argument("--bench", action="store_true", help="qsafe_hook latency from 2 to 1M entries")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+        return
+
+    try:
+        t0 = time.perf_counter()
+        al = Allowlist.load(args.path)
+        t1 = time.perf_counter()
+        worst = al.validate()
+    except (OSError, ValueError, struct.error) as e:
+        print(f"[-] Q-SAFE ALLOWLIST INVALID: {e}")
+        sys.exit(1)
+
+    print(f"[+] {args.path}: v{al.version}, {al.count} entries "
+          f"(mapped in {(t1 - t0) * 1e6:.0f}us, validated in {time.perf_counter() - t1:.3f}s)")
+    if not al.legacy:
+        print(f"    capacity {al.capacity}, load {al.count / al.capacity:.2f}, longest probe {worst}")
+    for h in args.check:
+        print(f"    {h}: {'ALLOWED' if int(h, 16) in al else 'UNKNOWN'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import resource
+import argparse
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+
+# Q-SAFE pipeline benchmark.
+# 1. Generate a synthetic tree (size, depth, fan-out, malicious ratio) in a
+#    temp directory, with a ground-truth count of planted signatures.
+# 2. Run each stage in its own interpreter, so peak RSS is per stage:
+#    discovery -> triage (clustering + zoning) -> deep scan (signatures) -> allowlist.
+# 3. Report latency, throughput and peak RSS as JSON; --compare flags
+#    regressions against an earlier report.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES = os.path.join(REPO_DIR, "signatures.txt")
+STAGES = ("discovery", "triage", "deep_scan", "allowlist")
+# Not under /tmp: "tmp" in a path makes every zone high-risk for the heuristics
+BENCH_BASE = os.getenv("QSAFE_BENCH_DIR", os.path.expanduser("~/.cache/qsafe-bench"))
+
+HOT_DIRS = ["Desktop", "Downloads", "tmp"]
+COLD_DIRS = ["lib", "src", "share", "docs", "build", "include", "cache", "data"]
+SCAN_EXTS = [".py", ".sh", ".txt", ".cpp", ".asm", ".elf", ".exe"]
+OTHER_EXTS = [".bin", ".dat", ".json"]
+
+def make_tree(root, files=10000, depth=5, fanout=4, malicious_ratio=0.01, hot_ratio=0.1,
+              file_size=2048, seed=1337):
+    """
+    Builds the fixture under root and returns its ground truth. Directory
+    names are drawn so that about hot_ratio of them look high-risk to the
+    triage heuristics; malicious files carry one signatures.txt pattern.
+    """
+    sys.path.insert(0, REPO_DIR)
+    from signature_engine import parse_rules
+
+    rng = random.Random(seed)
+    patterns = [p for _, p in parse_rules(RULES)]
+    dirs, frontier = [], [root]
+    for level in range(depth):
+        nxt = []
+        for parent in frontier:
+            for i in range(rng.randint(1, fanout)):
+                pool = HOT_DIRS if rng.random() < hot_ratio else COLD_DIRS
+                d = os.path.join(parent, f"{rng.choice(pool)}{level}_{i}")
+                os.makedirs(d, exist_ok=True)
+                nxt.append(d)
+        dirs.extend(nxt)
+        frontier = nxt
+    dirs = dirs or [root]
+
+    alphabet = b"abcdefghijklmnopqrstuvwxyz_ =()/.\n0123456789"
+    blob = bytes(rng.choice(alphabet) for _ in range(max(file_size * 4, 65536)))
+    truth = {"files": 0, "scan_files": 0, "malicious": 0, "bytes": 0, "dirs": len(dirs)}
+    for n in range(files):
+        ext = rng.choice(SCAN_EXTS) if rng.random() < 0.9 else rng.choice(OTHER_EXTS)
+        start = rng.randrange(len(blob) - file_size)
+        data = blob[start:start + file_size]
+        scanned = ext in SCAN_EXTS
+        if scanned and rng.random() < malicious_ratio:
+            pat = rng.choice(patterns)
+            at = rng.randrange(max(1, len(data) - len(pat)))
+            data = data[:at] + pat + data[at + len(pat):]
+            truth["malicious"] += 1
+        with open(os.path.join(rng.choice(dirs), f"f{n}{ext}"), "wb") as f:
+            f.write(data)
+        truth["files"] += 1
+        truth["scan_files"] += scanned
+        truth["bytes"] += len(data)
+    return truth
+
+# --- Stages (each runs in a fresh interpreter, cwd = work dir) ---
+
+def stage_discovery(tree, opts):
+    import discovery
+    t0 = time.perf_counter()
+    first = None
+    n = 0
+    for _ in discovery.write_scan_list(discovery.walk(tree, opts.get("workers")), "scan_list.txt"):
+        if first is None:
+            first = time.perf_counter() - t0
+        n += 1
+    return {"items": n, "unit": "files", "first_result_s": first}
+
+def stage_triage(tree, opts):
+    import agent_triage
+    agent_triage.API_KEY = None   # heuristics only: no network in a benchmark
+    with redirect_stdout(io.StringIO()):
+        agent_triage.main()
+    with open("scan_list.txt") as f:
+        n = sum(1 for _ in f)
+    with open("suspicious_targets.txt") as f:
+        targets = sum(1 for _ in f)
+    return {"items": n, "unit": "files", "targets": targets}
+
+def stage_deep_scan(tree, opts):
+    import deep_scan
+    with open("scan_list.txt") as f:
+        paths = [line.strip() for line in f if line.strip()]
+    with redirect_stdout(io.StringIO()):
+        counts = deep_scan.run_batch(paths, opts.get("workers"), rules_file=RULES, remote=False, cache_file=None)
+    size = sum(os.path.getsize(p) for p in paths)
+    return {"items": len(paths), "unit": "files", "mb": size / 1e6, "unsafe": counts["UNSAFE"],
+            "errors": counts["ERROR"]}
+
+def stage_allowlist(tree, opts):
+    import allowlist
+    import cfg_paths
+    rng = random.Random(opts.get("seed", 1337))
+    nodes = opts.get("cfg_nodes", 2000)
+    graph = {0x1000 + i: [0x1000 + rng.randrange(nodes) for _ in range(3)] for i in range(nodes)}
+    t0 = time.perf_counter()
+    walked, count, size, _ = cfg_paths.generate(graph, [0x1000], "allowlist.bin", opts.get("cfg_depth", 10),
+                                                opts.get("cfg_max_paths", 1 << 20))
+    t_gen = time.perf_counter() - t0
+
+    with allowlist.Allowlist.load("allowlist.bin") as al:
+        stored = [s for s in al.slots if s][:50000]
+        probes = stored + [rng.getrandbits(64) for _ in range(len(stored))]
+        rng.shuffle(probes)
+        t0 = time.perf_counter()
+        hits = sum(1 for h in probes if h in al)
+        t_lookup = time.perf_counter() - t0
+    return {"items": walked, "unit": "paths", "entries": count, "bytes": size, "generate_s": t_gen,
+            "lookups_per_s": len(probes) / t_lookup if t_lookup else None, "lookup_hits": hits}
+
+def run_stage(name, tree, opts):
+    # Child side: time one stage and print its JSON result
+    sys.path.insert(0, REPO_DIR)
+    os.environ["QSAFE_TELEMETRY"] = "off"
+    fn = globals()[f"stage_{name}"]
+    t0 = time.perf_counter()
+    result = fn(tree, opts)
+    result["seconds"] = time.perf_counter() - t0
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(result))
+
+def spawn_stage(name, tree, work, opts):
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-stage", name, "--tree", tree,
+           "--opts", json.dumps(opts)]
+    env = dict(os.environ, QSAFE_TELEMETRY="off", OPENROUTER_KEY="")
+    out = subprocess.run(cmd, cwd=work, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"stage {name} failed:\n{out.stderr.strip()}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def summarize(runs):
+    # Median latency over repeats; throughput from the median; worst RSS
+    best = dict(runs[len(runs) // 2])
+    secs = [r["seconds"] for r in runs]
+    best["seconds"] = statistics.median(secs)
+    best["seconds_min"] = min(secs)
+    best["seconds_max"] = max(secs)
+    best["throughput"] = best["items"] / best["seconds"] if best["seconds"] else None
+    best["peak_rss_kb"] = max(r["peak_rss_kb"] for r in runs)
+    return best
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(report, baseline, threshold):
+    # Returns the list of regressions (throughput drop or RSS growth beyond threshold)
+    regressions = []
+    print(f"[*] BENCH COMPARE: vs {baseline['meta'].get('commit')} (threshold {threshold:.0%})")
+    for name, new in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old or not old.get("throughput") or not new.get("throughput"):
+            continue
+        speed = new["throughput"] / old["throughput"] - 1
+        rss = new["peak_rss_kb"] / old["peak_rss_kb"] - 1
+        bad = speed < -threshold or rss > threshold
+        print(f"    {name:<10} throughput {speed:+7.1%}   peak RSS {rss:+7.1%}{'   <-- REGRESSION' if bad else ''}")
+        if bad:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE pipeline benchmark")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--malicious-ratio", type=float, default=0.01)
+    parser.add_argument("--file-size", type=int, default=2048)
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of " + ",".join(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--cfg-nodes", type=int, default=2000)
+    parser.add_argument("--cfg-depth", type=int, default=10)
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown / RSS growth")
+    parser.add_argument("--keep", action="store_true", help="keep the fixture directory")
+    # Internal: child process entry point
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--tree", help=argparse.SUPPRESS)
+    parser.add_argument("--opts", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args.run_stage, args.tree, json.loads(args.opts))
+        return
+
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    os.makedirs(BENCH_BASE, exist_ok=True)
+    base = tempfile.mkdtemp(prefix="run-", dir=BENCH_BASE)
+    tree, work = os.path.join(base, "tree"), os.path.join(base, "work")
+    os.makedirs(tree)
+    os.makedirs(work)
+    opts = {"workers": args.workers, "seed": args.seed, "cfg_nodes": args.cfg_nodes, "cfg_depth": args.cfg_depth}
+
+    try:
+        print(f"[*] BENCH: building fixture ({args.files} files, depth {args.depth}, "
+              f"malicious ratio {args.malicious_ratio}) in {base}")
+        t0 = time.perf_counter()
+        truth = make_tree(tree, args.files, args.depth, args.fanout, args.malicious_ratio,
+                          file_size=args.file_size, seed=args.seed)
+        print(f"    {truth['files']} files in {truth['dirs']} dirs, {truth['malicious']} malicious "
+              f"({time.perf_counter() - t0:.1f}s)")
+
+        # Stages depend on the previous ones' outputs (scan_list.txt, ...)
+        needed = [s for s in STAGES if s in stages or (s == "discovery" and {"triage", "deep_scan"} & set(stages))]
+        results = {}
+        for name in needed:
+            runs = [spawn_stage(name, tree, work, opts) for _ in range(max(1, args.repeat))]
+            results[name] = summarize(runs)
+            r = results[name]
+            print(f"    {name:<10} {r['seconds'] * 1000:9.1f} ms  {r['throughput']:12,.0f} {r['unit']}/s  "
+                  f"peak RSS {r['peak_rss_kb'] / 1024:7.1f} MB")
+
+        if "deep_scan" in results:
+            r = results["deep_scan"]
+            r["recall"] = r["unsafe"] / truth["malicious"] if truth["malicious"] else None
+            if r["unsafe"] != truth["malicious"]:
+                print(f"[!] BENCH: deep scan flagged {r['unsafe']} files, {truth['malicious']} were planted.")
+    finally:
+        if args.keep:
+            print(f"[*] BENCH: fixture kept at {base}")
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("run_stage", "tree", "opts")},
+        },
+        "fixture": truth,
+        "stages": {name: results[name] for name in stages if name in results},
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[+] BENCH: report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
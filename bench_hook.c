@@ -0,0 +1,57 @@
+// qsafe_hook latency benchmark.
+// Usage: ./bench_hook <allowlist.bin> [depth]   (driven by `python3 allowlist.py --bench`)
+// The allowlist must contain the rolling hashes of IDs 0x1001..0x1000+depth
+// (see allowlist.bench_path); prints nanoseconds per qsafe_hook call.
+
+#include <time.h>
+#include "qsafe_allowlist.h"
+
+#define BENCH_MAX_DEPTH 8
+#define BENCH_BUDGET_NS 200000000ULL   // ~0.2s per allowlist
+
+static uint64_t now_ns(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ULL + ts.tv_nsec;
+}
+
+static uint64_t depth = BENCH_MAX_DEPTH;
+
+static void replay(void) {
+    for (uint64_t i = 1; i <= depth; i++) {
+        qsafe_hook(0x1000 + i);
+    }
+}
+
+int main(int argc, char* argv[]) {
+    if (argc < 2) {
+        printf("Usage: %s <allowlist.bin> [depth]\n", argv[0]);
+        return 1;
+    }
+    if (argc > 2) {
+        depth = strtoull(argv[2], NULL, 10);
+    }
+
+    qsafe_allowlist al;
+    if (qsafe_read_allowlist(argv[1], &al) < 0) {
+        return 1;
+    }
+    qsafe_arm_allowlist(&al);
+    replay();   // warm-up (the monitor exits on violation)
+
+    // Re-arming resets the rolling context so every round replays the same path
+    uint64_t rounds = 0;
+    uint64_t total = 0;
+    while (total < BENCH_BUDGET_NS) {
+        uint64_t t0 = now_ns();
+        for (int k = 0; k < 64; k++) {
+            qsafe_arm_allowlist(&al);
+            replay();
+        }
+        total += now_ns() - t0;
+        rounds += 64;
+    }
+
+    printf("%.1f\n", (double)total / (double)(rounds * depth));
+    return 0;
+}
@@ -0,0 +1,126 @@
+import sys
+import time
+import argparse
+
+import allowlist
+
+# CFG-driven allowlist generation.
+# Nodes are function IDs (the values passed to qsafe_hook); an edge u -> v
+# means v's hook may run right after u's. Every path from an entry node up to
+# max_depth is a valid context, so its rolling hash goes into allowlist.bin.
+#
+# CFG file format (one edge or entry per line, IDs in hex or decimal):
+#   0x1111 0x2222      edge
+#   entry 0x1111       entry node (default: nodes nobody calls)
+#   # comment
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+DEFAULT_MAX_DEPTH = 16
+DEFAULT_MAX_PATHS = 1 << 20
+
+def load_cfg(path):
+    # Returns (graph {node: [callees]}, entries)
+    graph, entries = {}, []
+    with open(path) as f:
+        for line in f:
+            parts = line.split("#", 1)[0].split()
+            if not parts:
+                continue
+            if parts[0] == "entry":
+                entries.extend(int(p, 0) for p in parts[1:])
+                continue
+            if len(parts) != 2:
+                raise ValueError(f"bad CFG line: {line.strip()!r}")
+            u, v = int(parts[0], 0), int(parts[1], 0)
+            graph.setdefault(u, []).append(v)
+            graph.setdefault(v, [])
+    if not entries:
+        called = {v for callees in graph.values() for v in callees}
+        entries = [n for n in graph if n not in called]
+    return graph, entries
+
+def walk_paths(graph, entries, max_depth=DEFAULT_MAX_DEPTH, with_paths=False):
+    """
+    Depth-first walk yielding (hash, path) for every path of 1..max_depth nodes.
+    Each node extends its parent's hash with one shl/xor, so an edge costs
+    O(1) regardless of depth. path is the live DFS stack (None unless
+    with_paths); copy it if you keep it.
+    """
+    path = [] if with_paths else None
+    for entry in entries:
+        h0 = entry & MASK64
+        if with_paths:
+            path[:] = [entry]
+        yield h0, path
+        if max_depth < 2:
+            continue
+        # Stack of (callee iterator, hash of the path ending at its caller)
+        stack = [(iter(graph.get(entry, ())), h0)]
+        while stack:
+            callees, h = stack[-1]
+            node = next(callees, None)
+            if node is None:
+                stack.pop()
+                if with_paths:
+                    path.pop()
+                continue
+            nh = ((h << 1) & MASK64) ^ node
+            if with_paths:
+                path.append(node)
+            yield nh, path
+            if len(stack) < max_depth - 1:
+                stack.append((iter(graph.get(node, ())), nh))
+            elif with_paths:
+                path.pop()
+
+def generate(graph, entries, path=allowlist.ALLOWLIST_FILE, max_depth=DEFAULT_MAX_DEPTH,
+             max_paths=DEFAULT_MAX_PATHS):
+    """
+    Streams every path hash into allowlist.bin (see allowlist.AllowlistWriter).
+    Returns (paths walked, distinct hashes, file size, truncated).
+    """
+    writer = allowlist.AllowlistWriter(path, max_entries=max_paths)
+    walked, truncated = 0, False
+    try:
+        for h, _ in walk_paths(graph, entries, max_depth):
+            if walked == max_paths or not writer.add(h):
+                truncated = True
+                break
+            walked += 1
+    finally:
+        size = writer.close()
+    return walked, writer.count, size, truncated
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE CFG path enumerator -> allowlist.bin")
+    parser.add_argument("cfg", help="CFG edge list (see header of cfg_paths.py)")
+    parser.add_argument("-o", "--output", default=allowlist.ALLOWLIST_FILE)
+    parser.add_argument("--max-depth", type=int, default=DEFAULT_MAX_DEPTH, help="longest path, in calls")
+    parser.add_argument("--max-paths", type=int, default=DEFAULT_MAX_PATHS, help="stop after this many paths")
+    parser.add_argument("--show", action="store_true", help="print each path and its hash (small graphs)")
+    args = parser.parse_args()
+
+    try:
+        graph, entries = load_cfg(args.cfg)
+    except (OSError, ValueError) as e:
+        print(f"[-] Q-SAFE CFG ERROR: {e}")
+        sys.exit(1)
+    print(f"[*] CFG: {len(graph)} nodes, {sum(map(len, graph.values()))} edges, "
+          f"entries {[hex(e) for e in entries]}")
+
+    if args.show:
+        for n, (h, path) in enumerate(walk_paths(graph, entries, args.max_depth, with_paths=True)):
+            if n >= args.max_paths:
+                break
+            print(f"    {' -> '.join(hex(p) for p in path)}  =>  {hex(h)}")
+
+    t0 = time.perf_counter()
+    walked, count, size, truncated = generate(graph, entries, args.output, args.max_depth, args.max_paths)
+    dt = time.perf_counter() - t0
+    print(f"[+] {args.output}: {walked} paths, {count} distinct hashes, {size} bytes "
+          f"({dt:.2f}s, {walked / dt if dt else 0:,.0f} paths/s)")
+    if truncated:
+        print(f"[!] Path limit reached ({args.max_paths}); raise --max-paths or lower --max-depth.")
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,23 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import time
-import random
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime
 import os
-import binascii
+import html
 import math
+import sqlite3
+import threading
+from collections import Counter, deque
 import streamlit.components.v1 as components
 
+import telemetry
+import metrics
+import hexview
+from line_index import LineIndex
+import scanlist
+
 # --- Configuration & Setup ---
 st.set_page_config(
     page_title="Q-SAFE: HYPERION",
@@ -195,31 +203,218 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Logic & State ---
-if 'scan_history' not in st.session_state:
-    st.session_state.scan_history = []
-if 'depth_log' not in st.session_state:
-    st.session_state.depth_log = [150.0] * 50
+FEED_INTERVAL = 1.0   # seconds between live samples
+HISTORY_SECONDS = 24 * 3600   # telemetry replayed when the server starts
+STAGE_HISTORY = 60
+INTEL_ROWS = 50
+SCAN_LIST = "scan_list.txt"
+SCAN_LIST_BIN = scanlist.SCAN_LIST_FILE   # preferred when present
+TARGET_PAGE_SIZE = 100
+HIGH_ENTROPY = 7.2   # bits/byte; compressed, packed or encrypted data
+METRICS_FILE = metrics.METRICS_FILE or metrics.DEFAULT_FILE
+
+# st.fragment (Streamlit >= 1.37) re-runs only the decorated block
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+def style_fig(fig, margin):
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font_color='#ccc',
+        height=300,
+        margin=margin,
+    )
+    return fig
+
+class LiveFeed:
+    """
+    Shared producer for the live widgets. One background thread tails the
+    pipeline telemetry store (telemetry.py) and builds the figures once per
+    tick; every browser session renders the latest snapshot, so cost does
+    not grow with the number of viewers. Each poll reads only rows past the
+    cursor; aggregates are kept in memory.
+    """
+
+    def __init__(self, interval=FEED_INTERVAL, path=telemetry.TELEMETRY_FILE):
+        self.interval = interval
+        self.path = path
+        self.store = None
+        self.cursor = 0
+        self.totals = {"files": 0, "zones": 0, "high_risk": 0}
+        self.verdicts = Counter()
+        self.stage_log = deque(maxlen=STAGE_HISTORY)
+        self.recent = deque(maxlen=INTEL_ROWS)
+        self._lock = threading.Lock()
+        self._snapshot = self._sample()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _poll(self):
+        # Fold new telemetry rows into the aggregates
+        if self.store is None:
+            if not os.path.exists(self.path):
+                return
+            self.store = telemetry.TelemetryStore(self.path)
+            self.cursor = self.store.first_id_since(time.time() - HISTORY_SECONDS)
+        while True:
+            rows = self.store.after(self.cursor)
+            for e in rows:
+                self._apply(e)
+            if not rows:
+                break
+            self.cursor = rows[-1]["id"]
+
+    def _apply(self, e):
+        when = datetime.fromtimestamp(e["ts"])
+        kind, data = e["kind"], e["data"]
+        if kind == "stage":
+            self.stage_log.append({"time": when, "stage": e["name"], "seconds": e["value"]})
+            return
+        when = when.strftime("%H:%M:%S")
+        if kind == "discovered":
+            self.totals["files"] = int(e["value"])
+            self.recent.append((when, "DISCOVERY", "Filesystem Map", e["name"], f"{int(e['value'])} FILES"))
+        elif kind == "triage":
+            self.totals["zones"] = int(e["value"])
+            self.totals["high_risk"] = data.get("high_risk", 0)
+        elif kind == "zone":
+            action = f"QUEUED ({int(e['value'])})" if e["value"] is not None else "QUEUED"
+            self.recent.append((when, "TRIAGE", "High-Risk Zone", e["name"], action))
+        elif kind == "verdict":
+            self.verdicts[e["name"]] += 1
+            if data.get("reason") in ("cache", "signature", "llm"):
+                self.verdicts[data["reason"]] += 1
+            if e["name"] == "UNSAFE":
+                self.recent.append((when, "DEEP SCAN", data.get("rule") or data.get("reason"), data.get("path"), "FLAGGED"))
+            elif e["name"] == "ERROR":
+                self.recent.append((when, "DEEP SCAN", data.get("reason"), data.get("path"), "UNREADABLE"))
+
+    def _sample(self):
+        try:
+            self._poll()
+        except sqlite3.Error:
+            self.store = None
+
+        stages = pd.DataFrame(list(self.stage_log), columns=["time", "stage", "seconds"])
+        fig = px.line(
+            stages, x="time", y="seconds", color="stage", markers=True,
+            labels={'seconds':'Latency (s)', 'time':'Run'},
+        )
+        style_fig(fig, dict(l=0, r=0, t=10, b=0))
+        fig.update_layout(
+            xaxis=dict(visible=False),
+            yaxis=dict(gridcolor='rgba(255,255,255,0.1)'),
+            legend=dict(orientation='h', y=1.1),
+        )
+
+        # Radial Chart or similar
+        mix = ['SAFE', 'UNSAFE', 'ERROR', 'signature', 'cache']
+        fig_rad = go.Figure(go.Scatterpolar(
+            r=[self.verdicts[k] for k in mix],
+            theta=['SAFE', 'UNSAFE', 'UNREADABLE', 'SIGNATURE', 'CACHED'],
+            fill='toself',
+            line_color='#00bcd4'
+        ))
+        style_fig(fig_rad, dict(l=20, r=20, t=20, b=20))
+        fig_rad.update_layout(
+            polar=dict(
+                bgcolor='rgba(0,0,0,0)',
+                radialaxis=dict(visible=False),
+                angularaxis=dict(color='#888')
+            ),
+        )
+
+        intel = pd.DataFrame(list(reversed(self.recent)),
+                             columns=["TIMESTAMP", "SOURCE", "EVENT", "TARGET", "ACTION"])
+
+        last = {}
+        for row in self.stage_log:
+            last[row["stage"]] = row["seconds"]
+
+        return {"totals": dict(self.totals), "unsafe": self.verdicts["UNSAFE"], "last_stage": last,
+                "fig_latency": fig, "fig_verdicts": fig_rad, "intel": intel, "cursor": self.cursor}
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._sample()
+            with self._lock:
+                self._snapshot = snapshot
+
+    def latest(self):
+        with self._lock:
+            return self._snapshot
+
+@st.cache_resource
+def live_feed():
+    # One producer per server process, shared by all sessions
+    return LiveFeed()
 
 # --- Helper Functions ---
-@st.cache_data
-def load_scan_targets(limit=100):
+@st.cache_data(max_entries=4)
+def load_hot_paths(path, mtime):
+    # Timer percentiles from the metrics summary, one row per stage/timer
+    rows = []
+    for source, entry in metrics.load(path)["sources"].items():
+        for name, t in entry["timers"].items():
+            for q in ("p50", "p90", "p99"):
+                if t[q] is not None:
+                    rows.append({"timer": name, "stage": source, "quantile": q, "ms": t[q] * 1000,
+                                 "count": t["count"]})
+    return pd.DataFrame(rows, columns=["timer", "stage", "quantile", "ms", "count"])
+
+@st.cache_resource
+def scan_index():
+    # One line index per server; refresh() picks up appends and rewrites
+    return LineIndex(SCAN_LIST)
+
+@st.cache_resource(max_entries=1)
+def scan_list_bin(mtime_ns, size):
+    # Re-mapped whenever discovery replaces the file
+    return scanlist.ScanList.load(SCAN_LIST_BIN)
+
+def load_scan_targets(page=0, query="", prefix=False):
+    """
+    One page of scan list targets (optionally filtered) and the total
+    count, from scan_list.qsl if discovery wrote one, else scan_list.txt.
+    Only the requested lines / directories are read from disk.
+    """
     default_targets = ["/etc/passwd", "/etc/hosts", "/proc/version", "/proc/meminfo"]
-    if os.path.exists("scan_list.txt"):
-        with open("scan_list.txt") as f:
-            targets = [l.strip() for l in f.readlines() if l.strip()]
-            return (targets + default_targets)[:limit]
-    return default_targets
+    try:
+        info = os.stat(SCAN_LIST_BIN)
+        index = scan_list_bin(info.st_mtime_ns, info.st_size)
+    except (OSError, ValueError):
+        index = scan_index()
+        if index.refresh() < 0:
+            return default_targets, 0
+    if not len(index):
+        return default_targets, 0
+    if query:
+        hits = index.search(query, prefix, skip=page * TARGET_PAGE_SIZE, limit=TARGET_PAGE_SIZE)
+        return [t for _, t in hits], len(index)
+    return index.page(page * TARGET_PAGE_SIZE, TARGET_PAGE_SIZE), len(index)
 
+@st.cache_data(ttl=5, max_entries=64)
 def get_file_stats(path):
     try:
         stat = os.stat(path)
-        with open(path, "rb") as f:
-            head = f.read(64)
-        hexa = binascii.hexlify(head).decode()
-        hexa_fmt = ' '.join(hexa[i:i+2] for i in range(0, len(hexa), 2))
-        return stat.st_size, stat.st_mtime, hexa_fmt
-    except:
-        return 0, 0, "ACCESS DENIED"
+        return stat.st_size, stat.st_mtime
+    except OSError:
+        return 0, 0
+
+@st.cache_data(max_entries=64)
+def get_window(path, offset, size, mtime):
+    # size/mtime are part of the key so an edited file is re-read
+    try:
+        return hexview.read_window(path, offset, hexview.WINDOW)[1]
+    except OSError:
+        return None
+
+@st.cache_data(max_entries=32)
+def get_entropy_profile(path, size, mtime):
+    try:
+        return hexview.entropy_profile(path)
+    except (OSError, ValueError):
+        return None
 
 # --- Main Layout ---
 
@@ -236,108 +431,108 @@ with col_title:
 st.write("") # Spacer
 
 # 2. Glassmorphism Dashboard
-targets = load_scan_targets()
-
 with st.sidebar:
     st.header("🎮 COMMAND DECK")
     st.write("---")
     active_defense = st.toggle("ACTIVATE SHIELD", value=True)
     deep_scan = st.checkbox("DEEP HEURISTICS", value=False)
+    target_query = st.text_input("SEARCH TARGETS", placeholder="path fragment")
+    prefix_match = st.checkbox("PREFIX MATCH", value=False)
+    target_page = st.number_input("PAGE", min_value=1, value=1, step=1) - 1
+    targets, total = load_scan_targets(target_page, target_query, prefix_match)
+    if not targets:
+        targets = ["(no matches)"]
+    st.caption(f"{total:,} targets indexed" + (f" | page {target_page + 1}" if total else ""))
     target_select = st.selectbox("MANUAL TARGET", targets)
+    live_updates = st.toggle("LIVE FEED", value=True)
     st.write("---")
     st.info("System running in protected mode. Unauthorized access attempts will be logged.")
 
 # Tabs
 tab_ops, tab_intel, tab_forensics = st.tabs(["⚡ OPERATIONS", "📡 INTEL FEED", "🧬 FORENSICS"])
 
-with tab_ops:
+# Live widgets: only these fragments refresh each tick, from the shared feed
+refresh = FEED_INTERVAL if live_updates else None
+
+@fragment(run_every=refresh)
+def ops_panel():
+    snap = live_feed().latest()
+    totals, last = snap["totals"], snap["last_stage"]
+
+    def took(stage):
+        return f"{last[stage]:.2f}s" if stage in last else None
+
     # Metrics Container in Glass
     st.markdown('<div class="glass-card">', unsafe_allow_html=True)
     m1, m2, m3, m4 = st.columns(4)
-    
-    # Sim Data
-    depth = st.session_state.depth_log[-1] + random.uniform(-0.5, 0.5)
-    depth = max(100, min(200, depth))
-    st.session_state.depth_log.append(depth)
-    if len(st.session_state.depth_log) > 50: st.session_state.depth_log.pop(0)
-    
-    m1.metric("WELL PRESSURE", f"{int(depth * 15)} PSI", "+12")
-    m2.metric("FLUID DEPTH", f"{depth:.2f} m", "-0.1m")
-    m3.metric("CORE TEMP", "42°C", "Stable")
-    m4.metric("NETWORK LOAD", "1.2 GB/s", "+5%")
+    m1.metric("FILES MAPPED", f"{totals['files']:,}", took("discovery"), delta_color="off")
+    m2.metric("ZONES TRIAGED", f"{totals['zones']:,}", took("triage"), delta_color="off")
+    m3.metric("HIGH-RISK ZONES", f"{totals['high_risk']:,}")
+    m4.metric("UNSAFE VERDICTS", f"{snap['unsafe']:,}", took("deep_scan"), delta_color="off")
     st.markdown('</div>', unsafe_allow_html=True)
-    
+
     # Graphs in Glass
     c_graph, c_map = st.columns([2, 1])
-    
+
     with c_graph:
         st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-        st.subheader("HYDRAULIC MONITORING")
-        fig = px.area(
-            y=st.session_state.depth_log, 
-            labels={'y':'Depth (m)', 'x':'Time'},
-        )
-        fig.update_traces(line_color='#00ff41', fill_color='rgba(0, 255, 65, 0.1)')
-        fig.update_layout(
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font_color='#ccc',
-            height=300,
-            margin=dict(l=0, r=0, t=10, b=0),
-            xaxis=dict(visible=False),
-            yaxis=dict(gridcolor='rgba(255,255,255,0.1)')
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        st.subheader("PIPELINE LATENCY")
+        st.plotly_chart(snap["fig_latency"], use_container_width=True, key="fig_latency")
         st.markdown('</div>', unsafe_allow_html=True)
 
     with c_map:
         st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-        st.subheader("SECTOR STATUS")
-        # Radial Chart or similar
-        fig_rad = go.Figure(go.Scatterpolar(
-            r=[random.randint(60, 100) for _ in range(5)],
-            theta=['PU-1', 'VALVE-A', 'SENS-X', 'NET-G', 'CORE'],
-            fill='toself',
-            line_color='#00bcd4'
-        ))
-        fig_rad.update_layout(
-            paper_bgcolor='rgba(0,0,0,0)',
-            polar=dict(
-                bgcolor='rgba(0,0,0,0)',
-                radialaxis=dict(visible=False),
-                angularaxis=dict(color='#888')
-            ),
-            font_color='#ccc',
-            height=300,
-            margin=dict(l=20, r=20, t=20, b=20)
-        )
-        st.plotly_chart(fig_rad, use_container_width=True)
+        st.subheader("VERDICT MIX")
+        st.plotly_chart(snap["fig_verdicts"], use_container_width=True, key="fig_verdicts")
         st.markdown('</div>', unsafe_allow_html=True)
 
-with tab_intel:
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+    st.subheader("HOT PATHS")
+    mtime = get_file_stats(METRICS_FILE)[1]
+    hot = load_hot_paths(METRICS_FILE, mtime) if mtime else None
+    if hot is not None and len(hot):
+        fig_hot = px.bar(hot, x="timer", y="ms", color="quantile", barmode="group", log_y=True,
+                         hover_data=["stage", "count"], labels={'ms': 'Latency (ms)', 'timer': ''},
+                         color_discrete_sequence=['#00ff41', '#00bcd4', '#ff4b4b'])
+        style_fig(fig_hot, dict(l=0, r=0, t=10, b=0))
+        fig_hot.update_layout(yaxis=dict(gridcolor='rgba(255,255,255,0.1)'), legend=dict(orientation='h', y=1.1))
+        st.plotly_chart(fig_hot, use_container_width=True, key="fig_hot")
+        st.caption(f"Pipeline metrics: {METRICS_FILE} (updated {datetime.fromtimestamp(mtime):%H:%M:%S})")
+    else:
+        st.caption(f"No metrics yet: run the pipeline with QSAFE_METRICS={METRICS_FILE}")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@fragment(run_every=refresh)
+def intel_panel():
+    snap = live_feed().latest()
+
     st.markdown('<div class="glass-card">', unsafe_allow_html=True)
     st.subheader("LIVE THREAT INTELLIGENCE")
-    
-    df = pd.DataFrame({
-        "TIMESTAMP": [datetime.now().strftime("%H:%M:%S") for _ in range(5)],
-        "SOURCE IP": [f"192.168.1.{random.randint(10,99)}" for _ in range(5)],
-        "VECTOR": random.choices(["Buffer Overflow", "XSS", "SQL Injection", "Port Scan"], k=5),
-        "ACTION": ["BLOCKED"] * 5
-    })
-    
     st.dataframe(
-        df,
+        snap["intel"],
         use_container_width=True,
         hide_index=True
     )
-    st.caption("Monitoring active channels: 0x88f - 0xff2")
+    st.caption(f"Pipeline telemetry: {telemetry.TELEMETRY_FILE} (event #{snap['cursor']})")
     st.markdown('</div>', unsafe_allow_html=True)
 
+with tab_ops:
+    ops_panel()
+
+with tab_intel:
+    intel_panel()
+
 with tab_forensics:
     col_file, col_hex = st.columns([1, 2])
     
     # File Details
-    size, mtime, hexdump = get_file_stats(target_select)
+    size, mtime = get_file_stats(target_select)
+    n_windows = max(1, -(-size // hexview.WINDOW))
+    window = st.number_input(f"WINDOW ({hexview.WINDOW} BYTES, {n_windows:,} TOTAL)",
+                             min_value=0, max_value=n_windows - 1, value=0, step=1)
+    offset = window * hexview.WINDOW
+    data = get_window(target_select, offset, size, mtime)
+    profile = get_entropy_profile(target_select, size, mtime) if size else None
     
     with col_file:
         st.markdown(f'<div class="glass-card"><h3>TARGET: {os.path.basename(target_select)}</h3>', unsafe_allow_html=True)
@@ -345,22 +540,36 @@ with tab_forensics:
         st.write(f"SIZE: {size} bytes")
         st.write(f"MODIFIED: {datetime.fromtimestamp(mtime) if mtime else 'N/A'}")
         
-        status = "SAFE" if size < 100000 else "SUSPICIOUS (SIZE)"
+        peak = float(profile[1].max()) if profile is not None and len(profile[1]) else 0.0
+        if peak > HIGH_ENTROPY:
+            status = "SUSPICIOUS (PACKED/ENCRYPTED REGION)"
+        else:
+            status = "SAFE" if size < 100000 else "SUSPICIOUS (SIZE)"
         st.write(f"AI ANALYSIS: **{status}**")
-        st.progress(random.randint(80, 100) if status == "SAFE" else random.randint(20, 50))
+        st.write(f"PEAK ENTROPY: {peak:.2f} bits/byte")
+        st.progress(min(1.0, peak / 8))
         st.markdown('</div>', unsafe_allow_html=True)
         
     with col_hex:
-        st.markdown("### MEMORY DUMP (FIRST 64 BYTES)")
-        html_hex = f"""
-        <div class="hex-display">
-00000000  {hexdump[:48]}  |{'.' * 16}|
-00000010  {hexdump[48:] if len(hexdump) > 48 else ''} ...
-        </div>
-        """
-        st.markdown(html_hex, unsafe_allow_html=True)
+        st.markdown(f"### MEMORY DUMP (0x{offset:08x} - 0x{offset + len(data or b''):08x})")
+        dump = "\n".join(hexview.hexdump_lines(data, offset)) if data is not None else "ACCESS DENIED"
+        st.markdown(f'<div class="hex-display"><pre>{html.escape(dump)}</pre></div>', unsafe_allow_html=True)
         st.warning("Authorized Personnel Only. Artifact usage is logged.")
 
-# Auto Refresh
-time.sleep(1)
-st.rerun()
+    if profile is not None and len(profile[0]):
+        c_ent, c_hist = st.columns([2, 1])
+        with c_ent:
+            st.subheader("ENTROPY PROFILE")
+            fig_ent = px.line(x=profile[0], y=profile[1], labels={'x':'Offset', 'y':'Bits/byte'})
+            fig_ent.update_traces(line_color='#00ff41')
+            fig_ent.add_hline(y=HIGH_ENTROPY, line_dash="dot", line_color="#ff4b4b")
+            fig_ent.add_vline(x=offset, line_color="#00bcd4")
+            style_fig(fig_ent, dict(l=0, r=0, t=10, b=0))
+            fig_ent.update_layout(yaxis=dict(range=[0, 8], gridcolor='rgba(255,255,255,0.1)'))
+            st.plotly_chart(fig_ent, use_container_width=True)
+        with c_hist:
+            st.subheader("BYTE HISTOGRAM")
+            fig_hist = px.bar(x=np.arange(256), y=profile[2], labels={'x':'Byte', 'y':'Count'})
+            fig_hist.update_traces(marker_color='#00bcd4')
+            style_fig(fig_hist, dict(l=0, r=0, t=10, b=0))
+            st.plotly_chart(fig_hist, use_container_width=True)
@@ -0,0 +1,385 @@
+import os
+import sys
+import json
+import mmap
+import fcntl
+import time
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from signature_engine import SignatureEngine, RULES_FILE
+from verdict_cache import VerdictCache, CACHE_FILE, content_digest, prompt_version
+import agent_triage
+import hexview
+import metrics
+import scanlist
+import telemetry
+
+# Logic:
+# 1. Map the whole target read-only (one read, no copies).
+# 2. Tiers, cheapest first; each one can end the analysis with a verdict:
+#    filetype   -- empty files; binaries (magic bytes)
+#    content    -- entropy and printable ratio of the excerpt the remote
+#                  model would see: non-printable data and plain text (no
+#                  code extension, no risky token) are ruled out for the
+#                  remote call; packed data (high entropy) is always sent
+#    signatures -- the signature engine over the mapping chunk by chunk (the
+#                  automaton state carries across chunks). Files ruled out
+#                  above are still scanned here: a hit is the only local way
+#                  to UNSAFE, and it is cheap next to a remote call
+#    remote     -- the SAME bytes go to the remote analyzer (unless the
+#                  verdict cache already knows this content). Files that
+#                  get no remote verdict are recorded with tier "local"
+# 3. Exit status 1 = UNSAFE, 0 = SAFE.
+# Batch mode (--batch) runs steps 1-3 over suspicious_targets.txt (or .qsl) on a worker
+# pool, writes a JSONL verdict report and the list of UNSAFE paths that
+# guardian reviews for neutralization at the end (plus whatever watch.py
+# flagged since the previous batch).
+
+DEEP_MODEL = "mistralai/mistral-7b-instruct:free"
+DEEP_PROMPT = "Deep Code Analysis. Check for buffer overflows, shellcode, rm -rf, or reverse shells. Reply UNSAFE if malicious, SAFE otherwise."
+
+CHUNK_SIZE = 1 << 20
+# Remote models have a bounded context; only the head of large files is sent
+REMOTE_MAX_BYTES = 64 * 1024
+# Cached verdicts are only reused for the same model, prompt and excerpt size
+PROMPT_VERSION = prompt_version(DEEP_PROMPT, REMOTE_MAX_BYTES)
+
+# --batch exit status when some files got no verdict (ERROR, or no remote
+# verdict): the review still runs, but guardian keeps the manifest pending
+EXIT_INCOMPLETE = 3
+
+REPORT_FILE = "deep_report.jsonl"
+UNSAFE_LIST = "unsafe_targets.txt"
+WATCH_QUEUE = "watch_unsafe.txt"   # watch.py detections, moved into UNSAFE_LIST by the next batch
+
+# Path marker checked on the file name, like guardian.asm's sig_deep strstr
+PATH_SIGNATURE = "deep_core"
+
+TIERS = ("filetype", "content", "signatures", "remote")
+# Tier of files that passed every local tier but got no remote verdict
+# (--no-remote, no API key, or the call failed); they never reached "remote"
+UNDECIDED = "local"
+PACKED_ENTROPY = 7.2       # bits/byte, as on the dashboard's forensics tab
+TEXT_MIN_PRINTABLE = 0.95
+# Text files go to the remote tier if they are code or contain one of these
+CODE_EXTS = (".py", ".sh", ".asm", ".cpp", ".elf", ".exe")
+RISK_TOKENS = (b"#!", b"eval", b"exec", b"system(", b"popen", b"socket", b"base64", b"curl ", b"wget ",
+               b"chmod", b"/bin/sh", b"/dev/tcp", b"rm -rf", b"nc -e", b"subprocess")
+MAGIC = ((b"\x7fELF", "elf"), (b"MZ", "pe"), (b"\xca\xfe\xba\xbe", "macho"), (b"\xcf\xfa\xed\xfe", "macho"),
+         (b"PK\x03\x04", "zip"), (b"\x1f\x8b", "gzip"), (b"%PDF", "pdf"), (b"\x89PNG", "png"),
+         (b"\xff\xd8\xff", "jpeg"), (b"GIF8", "gif"))
+
+@contextmanager
+def open_view(path):
+    """
+    Read-only memoryview over the whole file. Regular files are mmap'd, so
+    pages are read once by the kernel and shared with every consumer; empty
+    and special files (which cannot be mapped) fall back to a single read.
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            yield memoryview(f.read())
+            return
+
+    try:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            view.release()
+    finally:
+        mm.close()
+
+def iter_chunks(view, size=CHUNK_SIZE):
+    # Zero-copy slices of the mapping
+    for off in range(0, len(view), size):
+        yield off, view[off:off + size]
+
+@metrics.timed("deep_scan.signatures")
+def signature_scan(engine, view, chunk_size=CHUNK_SIZE):
+    # First (offset, rule) hit over the whole view, or None
+    state = 0
+    for off, chunk in iter_chunks(view, chunk_size):
+        state, hits = engine.feed(chunk, state, off, first_only=True)
+        chunk.release()
+        if hits:
+            hit_off, idx = hits[0]
+            return hit_off, engine.names[idx]
+    return None
+
+def file_type(view):
+    # Binary format from the magic bytes, or None
+    head = bytes(view[:4])
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+def content_score(head):
+    # (Shannon entropy in bits/byte, share of printable ASCII) of head
+    entropy, hist = hexview.block_stats(head, len(head))
+    hist = hist[0]
+    printable = int(hist[32:127].sum() + hist[9] + hist[10] + hist[13])
+    return float(entropy[0]), printable / len(head)
+
+@metrics.timed("deep_scan.gate")
+def remote_gate(path, view):
+    """
+    Tiers 1-2 for the remote call. Returns (tier, reason) when the file is
+    not worth sending, or None. Packed or encrypted data is always sent:
+    it can hide anything, so it is never settled locally.
+    """
+    kind = file_type(view)
+    if kind:
+        return "filetype", "binary"
+    head = bytes(view[:REMOTE_MAX_BYTES])
+    entropy, printable = content_score(head)
+    if entropy > PACKED_ENTROPY:
+        return None
+    if printable < TEXT_MIN_PRINTABLE:
+        return "content", "binary"
+    if not path.endswith(CODE_EXTS) and not any(t in head for t in RISK_TOKENS):
+        return "content", "plain_text"
+    return None
+
+@metrics.timed("deep_scan.remote")
+def remote_scan(view, cache=None):
+    """
+    Remote verdict on the already-mapped bytes.
+    Returns (unsafe, cached): unsafe is True/False, or None if unavailable.
+    """
+    digest = None
+    if cache is not None:
+        digest = content_digest(view)
+        verdict = cache.get(digest, DEEP_MODEL, PROMPT_VERSION)
+        if verdict is not None:
+            metrics.count("deep_scan.cache_hits")
+            return verdict == "UNSAFE", True
+
+    code = bytes(view[:REMOTE_MAX_BYTES]).decode(errors="ignore")
+    response = agent_triage.call_llm("Code: " + code, model=DEEP_MODEL, system=DEEP_PROMPT,
+                                    metric="deep_scan.call_llm")
+    if response is None:
+        return None, False
+
+    unsafe = "UNSAFE" in response
+    if cache is not None:
+        cache.put(digest, DEEP_MODEL, PROMPT_VERSION, "UNSAFE" if unsafe else "SAFE")
+    return unsafe, False
+
+@metrics.timed("deep_scan.file")
+def analyze(path, engine, remote=True, cache=None):
+    """
+    Deep analysis of one file through the tiers (see the top of this file).
+    Returns a verdict dict: path, verdict (SAFE/UNSAFE/ERROR), reason, the
+    tier that decided, and rule/offset for signature hits.
+    """
+    result = {"path": path, "verdict": "SAFE", "reason": "no_remote", "tier": UNDECIDED}
+
+    if PATH_SIGNATURE in path:
+        result.update(verdict="UNSAFE", reason="signature", tier="signatures", rule="path." + PATH_SIGNATURE,
+                      offset=None)
+        return result
+
+    try:
+        with open_view(path) as view:
+            result["size"] = len(view)
+            metrics.count("deep_scan.bytes", len(view))
+            if not len(view):
+                result.update(reason="empty", tier="filetype")
+                return result
+            gate = remote_gate(path, view) if remote else None
+
+            hit = signature_scan(engine, view) if len(view) >= engine.min_length else None
+            if hit:
+                result.update(verdict="UNSAFE", reason="signature", tier="signatures", rule=hit[1], offset=hit[0])
+                return result
+            if gate:
+                result.update(tier=gate[0], reason=gate[1])
+                return result
+
+            if remote and agent_triage.llm_available():
+                unsafe, cached = remote_scan(view, cache)
+                if unsafe is None:
+                    result.update(reason="remote_failed")
+                else:
+                    result.update(verdict="UNSAFE" if unsafe else "SAFE", reason="cache" if cached else "llm",
+                                  tier="remote")
+    except OSError as e:
+        result.update(verdict="ERROR", reason=e.strerror or "unreadable", tier=None)
+    except Exception as e:
+        # One bad file must not take down the whole batch
+        result.update(verdict="ERROR", reason=f"{type(e).__name__}: {e}", tier=None)
+    return result
+
+def tier_funnel(decided):
+    """
+    [(tier, files reaching it, files it decided, reject rate)] from
+    {tier: files decided there}; a file reaches every tier up to its own.
+    UNDECIDED files pass every local tier and stop before "remote".
+    """
+    funnel = []
+    remaining = sum(decided.get(t, 0) for t in TIERS + (UNDECIDED,))
+    for tier in TIERS:
+        if tier == TIERS[-1]:
+            remaining -= decided.get(UNDECIDED, 0)
+        n = decided.get(tier, 0)
+        funnel.append((tier, remaining, n, n / remaining if remaining else 0.0))
+        remaining -= n
+    return funnel
+
+# --- Batch executor ---
+# Each worker compiles the rules once; only paths and verdict dicts cross
+# the process boundary.
+_worker = {}
+
+def _init_worker(rules_file, remote, cache_file):
+    _worker["engine"] = SignatureEngine.from_rules(rules_file)
+    _worker["remote"] = remote
+    use_cache = remote and cache_file and agent_triage.llm_available()
+    _worker["cache"] = VerdictCache(cache_file) if use_cache else None
+
+def _analyze_in_worker(path):
+    return analyze(path, _worker["engine"], _worker["remote"], _worker["cache"])
+
+def queue_unsafe(path, queue=WATCH_QUEUE):
+    # Appends one UNSAFE path to a review queue; safe against a concurrent drain_queue()
+    with open(queue + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with open(queue, "a") as f:
+            f.write(path + "\n")
+
+def drain_queue(queue=WATCH_QUEUE):
+    # Empties the queue; returns its paths that still exist, first occurrence first
+    try:
+        with open(queue + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(queue, "r+", errors="ignore") as f:
+                paths = [line.strip() for line in f if line.strip()]
+                f.truncate(0)
+    except FileNotFoundError:
+        return []
+    return [p for p in dict.fromkeys(paths) if os.path.exists(p)]
+
+def run_batch(paths, workers=None, pool="process", rules_file=RULES_FILE, remote=True,
+              report=REPORT_FILE, unsafe_list=UNSAFE_LIST, cache_file=CACHE_FILE, watch_queue=None):
+    """
+    Analyzes paths on a process pool (CPU-bound signature scans) or a thread
+    pool (remote-heavy runs). Verdicts stream to the JSONL report in input
+    order; UNSAFE paths are collected for the final review step, followed
+    by the watcher's detections from watch_queue, if given.
+    Returns {verdict: count, "queued": watcher paths added} plus
+    "tiers": {tier: files decided there}.
+    """
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+    counts = {"SAFE": 0, "UNSAFE": 0, "ERROR": 0, "cached": 0, "queued": 0}
+    flagged = set()
+    tiers = Counter()
+    events = []
+
+    with executor(max_workers=workers, initializer=_init_worker, initargs=(rules_file, remote, cache_file)) as ex, \
+         open(report, "w") as rep, open(unsafe_list, "w") as uns:
+        for result in ex.map(_analyze_in_worker, paths, chunksize=8 if pool == "process" else 1):
+            counts[result["verdict"]] += 1
+            metrics.count("deep_scan." + result["verdict"])
+            counts["cached"] += result["reason"] == "cache"
+            if result["tier"]:
+                tiers[result["tier"]] += 1
+                metrics.count("deep_scan.tier." + result["tier"])
+            rep.write(json.dumps(result) + "\n")
+            if result["verdict"] == "UNSAFE":
+                uns.write(result["path"] + "\n")
+                flagged.add(result["path"])
+                print(f"    [!] {result['path']}: {result.get('rule') or result['reason']}")
+            events.append(("deep_scan", "verdict", result["verdict"], None,
+                            {"path": result["path"], "reason": result["reason"], "tier": result["tier"],
+                             "rule": result.get("rule")}))
+            if len(events) >= 256:
+                telemetry.emit_many(events)
+                events = []
+        # Flagged by watch.py since the last batch: reviewed together
+        for p in drain_queue(watch_queue) if watch_queue else []:
+            if p not in flagged:
+                uns.write(p + "\n")
+                counts["queued"] += 1
+    telemetry.emit_many(events)
+    counts["tiers"] = {t: tiers[t] for t in TIERS + (UNDECIDED,)}
+    return counts
+
+def batch_main(args):
+    try:
+        paths = list(scanlist.read_paths(args.batch))
+    except (OSError, ValueError) as e:
+        print(f"[-] DEEP SCAN: cannot read {args.batch}: {getattr(e, 'strerror', None) or e}")
+        sys.exit(1)
+
+    workers = args.workers or os.cpu_count() or 1
+    metrics.start("deep_scan")
+    print(f"[*] DEEP SCAN: {len(paths)} vectors across {workers} {args.pool} workers...")
+    t0 = time.perf_counter()
+    counts = run_batch(paths, workers, args.pool, args.rules, not args.no_remote,
+                       args.report, args.unsafe_list, None if args.no_cache else args.cache, args.watch_queue)
+    dt = time.perf_counter() - t0
+    metrics.observe("stage.deep_scan", dt)
+    print(f"[*] DEEP SCAN: {counts['UNSAFE']} UNSAFE, {counts['SAFE']} SAFE, {counts['ERROR']} unreadable "
+          f"in {dt:.2f}s ({counts['cached']} verdicts from cache). Report: {args.report}")
+    funnel = tier_funnel(counts["tiers"])
+    for tier, reached, decided, rate in funnel:
+        share = f"{rate:6.1%} reject rate" if tier != TIERS[-1] else \
+            f"{reached / funnel[0][1] if funnel[0][1] else 0:6.1%} of all files"
+        print(f"    tier {tier:<10} {reached:>8} in  {decided:>8} decided  ({share})")
+    if counts["tiers"][UNDECIDED]:
+        print(f"    {counts['tiers'][UNDECIDED]} files passed the local tiers without a remote verdict "
+              f"({'--no-remote' if args.no_remote else 'no API key or remote call failed'}).")
+    if counts["queued"]:
+        print(f"[*] DEEP SCAN: {counts['queued']} detections from watch.py added to {args.unsafe_list}.")
+    telemetry.emit("deep_scan", "stage", "deep_scan", dt, files=len(paths), workers=workers, **counts)
+    unscanned = counts["ERROR"] + counts["tiers"][UNDECIDED]
+    if unscanned:
+        print(f"[-] DEEP SCAN: {unscanned} files left without a verdict; they will be scanned again next run.")
+        sys.exit(EXIT_INCOMPLETE)
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE whole-file deep scan")
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("-r", "--rules", default=RULES_FILE)
+    parser.add_argument("--no-remote", action="store_true", help="signatures only, never call the LLM")
+    parser.add_argument("--batch", nargs="?", const="suspicious_targets.txt", metavar="TARGETS",
+                        help="scan every path listed in TARGETS on a worker pool")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--pool", choices=["process", "thread"], default="process")
+    parser.add_argument("--report", default=REPORT_FILE)
+    parser.add_argument("--unsafe-list", default=UNSAFE_LIST)
+    parser.add_argument("--watch-queue", default=WATCH_QUEUE,
+                        help="watch.py detections to add to the review list ('' to leave them)")
+    parser.add_argument("--cache", default=CACHE_FILE, help="persistent LLM verdict cache")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    if args.batch:
+        batch_main(args)
+        return
+    if not args.path:
+        parser.error("a path or --batch is required")
+
+    metrics.start("deep_scan")
+    engine = SignatureEngine.from_rules(args.rules)
+    use_cache = not (args.no_remote or args.no_cache) and agent_triage.llm_available()
+    cache = VerdictCache(args.cache) if use_cache else None
+    result = analyze(args.path, engine, remote=not args.no_remote, cache=cache)
+
+    if result["reason"] == "signature":
+        where = f" @ 0x{result['offset']:x}" if result.get("offset") is not None else ""
+        print(f"        [!] DEEP CORE SIGNATURE DETECTED: {result['rule']}{where}")
+    sys.exit(1 if result["verdict"] == "UNSAFE" else 0)
+
+if __name__ == "__main__":
+    main()
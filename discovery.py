@@ -0,0 +1,298 @@
+import os
+import time
+import queue
+import struct
+import argparse
+import threading
+import subprocess
+from functools import partial
+
+import metrics
+import scanlist
+import telemetry
+
+# Logic:
+# 1. Seed a shared work queue with the scan root.
+# 2. Worker threads pull directories, os.scandir() them, push subdirectories back.
+# 3. Matching files are streamed to the caller in per-directory batches.
+# 4. Output scan_list.txt, or the binary scan_list.qsl for an -o ending in .qsl
+#    (and optionally feed agent_triage directly).
+#    With --incremental only files that changed since the last manifest are output.
+#    The new manifest is staged as scan_manifest.bin.pending and only replaces
+#    the old one on --commit-manifest, once the deep scan has seen those files;
+#    until then the next run reports the same files again.
+
+# Same filter as guardian.asm's original `find / ... -name '*.py' -o ...` command
+SCAN_EXTS = (".py", ".sh", ".elf", ".exe", ".txt", ".cpp", ".asm")
+# Pruned during the walk instead of filtered afterwards by the agent
+EXCLUDE_DIRS = frozenset(["/proc", "/sys", "/snap"])
+
+FIND_CMD = ("find {root} -type f \\( -name '*.py' -o -name '*.sh' -o -name '*.elf' -o -name '*.exe' "
+            "-o -name '*.txt' -o -name '*.cpp' -o -name '*.asm' \\) -mount 2>/dev/null")
+
+# Manifest: header (magic, version, flags, count) then one record per file:
+# inode, size, mtime_ns, path length, path bytes
+MANIFEST_FILE = "scan_manifest.bin"
+PENDING_SUFFIX = ".pending"
+MANIFEST_MAGIC = b"QSMF"
+MANIFEST_VERSION = 1
+_HDR = struct.Struct("<4sHHQ")
+_REC = struct.Struct("<QQqI")
+
+_DONE = object()
+
+@metrics.timed("discovery.list_dir")
+def list_dir(path, dev=None, with_stat=False):
+    """
+    One scandir pass over a directory.
+    Returns (matching regular files, subdirectories to descend into).
+    Symlinks are never followed and, when dev is set, directories on another
+    filesystem are skipped (find -mount).
+    With with_stat, files are (path, inode, size, mtime_ns) tuples.
+    """
+    files, subdirs = [], []
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return files, subdirs
+
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path in EXCLUDE_DIRS:
+                        continue
+                    if dev is not None and entry.stat(follow_symlinks=False).st_dev != dev:
+                        continue
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(SCAN_EXTS) and entry.is_file(follow_symlinks=False):
+                    if with_stat:
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, st.st_ino, st.st_size, st.st_mtime_ns))
+                    else:
+                        files.append(entry.path)
+            except OSError:
+                continue
+    return files, subdirs
+
+def walk(root="/", workers=None, one_fs=True, lister=list_dir):
+    """
+    Parallel filesystem walk. Yields matching file paths as soon as their
+    directory has been listed, so triage can start before the walk finishes.
+    Directories (not just top-level ones) are shared through one queue, so a
+    single huge tree like /usr does not pin the whole walk to one thread.
+    """
+    root = os.path.abspath(root)
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    try:
+        dev = os.stat(root).st_dev if one_fs else None
+    except OSError:
+        return
+
+    todo = queue.SimpleQueue()
+    out = queue.SimpleQueue()
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = [1]  # directories queued or being listed
+
+    def worker():
+        while True:
+            d = todo.get()
+            if d is None:
+                return
+            if stop.is_set():
+                files, subdirs = [], []
+            else:
+                files, subdirs = lister(d, dev)
+            if files:
+                out.put(files)
+            with lock:
+                pending[0] += len(subdirs) - 1
+                finished = pending[0] == 0
+            for s in subdirs:
+                todo.put(s)
+            if finished:
+                for _ in range(workers):
+                    todo.put(None)
+                out.put(_DONE)
+
+    todo.put(root)
+    for _ in range(workers):
+        threading.Thread(target=worker, daemon=True).start()
+
+    try:
+        while True:
+            batch = out.get()
+            if batch is _DONE:
+                return
+            yield from batch
+    finally:
+        # Consumer gave up early: let the workers drain without listing
+        stop.set()
+
+def load_manifest(path=MANIFEST_FILE):
+    # {path: (inode, size, mtime_ns)} from a previous run, {} if none/invalid
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return {}
+    if len(data) < _HDR.size:
+        return {}
+    magic, version, _, count = _HDR.unpack_from(data)
+    if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+        return {}
+
+    entries = {}
+    off = _HDR.size
+    try:
+        for _ in range(count):
+            ino, size, mtime, n = _REC.unpack_from(data, off)
+            off += _REC.size
+            entries[os.fsdecode(data[off:off + n])] = (ino, size, mtime)
+            off += n
+    except struct.error:
+        return {}
+    return entries
+
+def diff_manifest(records, path=MANIFEST_FILE, stats=None):
+    """
+    Streams (path, inode, size, mtime_ns) records into a new manifest and
+    yields only paths that are new or whose inode/size/mtime changed.
+    The new manifest is staged at path + PENDING_SUFFIX once the whole walk
+    has been consumed; commit_manifest() makes it current.
+    """
+    old = load_manifest(path)
+    stats = stats if stats is not None else {}
+    stats.update(new=0, modified=0, unchanged=0, removed=0)
+
+    tmp = path + ".tmp"
+    count = 0
+    with open(tmp, "wb") as f:
+        f.write(_HDR.pack(MANIFEST_MAGIC, MANIFEST_VERSION, 0, 0))
+        for p, ino, size, mtime in records:
+            raw = os.fsencode(p)
+            f.write(_REC.pack(ino, size, mtime, len(raw)))
+            f.write(raw)
+            count += 1
+
+            prev = old.pop(p, None)
+            if prev is None:
+                stats["new"] += 1
+                yield p
+            elif prev != (ino, size, mtime):
+                stats["modified"] += 1
+                yield p
+            else:
+                stats["unchanged"] += 1
+
+        f.seek(0)
+        f.write(_HDR.pack(MANIFEST_MAGIC, MANIFEST_VERSION, 0, count))
+
+    os.replace(tmp, path + PENDING_SUFFIX)
+    stats["removed"] = len(old)
+
+def commit_manifest(path=MANIFEST_FILE):
+    # Promotes the staged manifest; False if no run is pending
+    try:
+        os.replace(path + PENDING_SUFFIX, path)
+    except FileNotFoundError:
+        return False
+    return True
+
+def write_scan_list(paths, path="scan_list.txt", counts=None, stat=False):
+    # Tee the stream into the scan list for guardian / batch triage.
+    # The format follows the extension (see scanlist.py); with stat, paths
+    # are list_dir(with_stat=True) records.
+    n = 0
+    for p in scanlist.write_paths(paths, path, stat):
+        n += 1
+        yield p
+    if counts is not None:
+        counts["files"] = n
+
+def benchmark(root="/", workers=None):
+    print(f"[*] DISCOVERY BENCH: root={root}")
+
+    t0 = time.perf_counter()
+    out = subprocess.run(FIND_CMD.format(root=root), shell=True, capture_output=True)
+    t_find = time.perf_counter() - t0
+    n_find = out.stdout.count(b"\n")
+    print(f"    find (serial)     : {n_find:>8} files in {t_find:8.3f}s")
+
+    t0 = time.perf_counter()
+    first = None
+    n_walk = 0
+    for _ in walk(root, workers):
+        if first is None:
+            first = time.perf_counter() - t0
+        n_walk += 1
+    t_walk = time.perf_counter() - t0
+    print(f"    scandir (parallel): {n_walk:>8} files in {t_walk:8.3f}s (first path after {first or 0:.3f}s)")
+
+    if t_walk > 0:
+        print(f"    speedup: {t_find / t_walk:.2f}x")
+    if n_find != n_walk:
+        print(f"[!] Count mismatch ({n_find} vs {n_walk}): find does not prune {', '.join(sorted(EXCLUDE_DIRS))}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE parallel filesystem discovery")
+    parser.add_argument("root", nargs="?", default="/")
+    parser.add_argument("-o", "--output", default="scan_list.txt")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--triage", action="store_true", help="stream results straight into agent_triage")
+    parser.add_argument("--bench", action="store_true", help="compare against the find shell-out")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only output files new/modified since the last manifest")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--commit-manifest", action="store_true",
+                        help="mark the last --incremental run as scanned (call after the deep scan)")
+    parser.add_argument("--stat", action="store_true",
+                        help="store inode, size and mtime per file in a .qsl output (full walks only)")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.root, args.workers)
+        return
+    if args.commit_manifest:
+        if commit_manifest(args.manifest):
+            print(f"[+] DISCOVERY: {args.manifest} updated; scanned files will be skipped next run.")
+        else:
+            print(f"[-] DISCOVERY: no pending manifest ({args.manifest}{PENDING_SUFFIX}).")
+        return
+
+    metrics.start("discovery")
+    t0 = time.perf_counter()
+    stats = {}
+    counts = {"files": 0}
+    if args.incremental:
+        records = walk(args.root, args.workers, lister=partial(list_dir, with_stat=True))
+        paths = write_scan_list(diff_manifest(records, args.manifest, stats), args.output, counts)
+    elif args.stat:
+        records = walk(args.root, args.workers, lister=partial(list_dir, with_stat=True))
+        paths = write_scan_list(records, args.output, counts, stat=True)
+    else:
+        paths = write_scan_list(walk(args.root, args.workers), args.output, counts)
+
+    if args.triage:
+        import agent_triage
+        agent_triage.stream_main(paths)
+    else:
+        for _ in paths:
+            pass
+        print(f"[*] DISCOVERY: {counts['files']} vectors mapped in {time.perf_counter() - t0:.2f}s.")
+
+    if stats:
+        print(f"[*] DISCOVERY: Manifest diff -- {stats['new']} new, {stats['modified']} modified, "
+              f"{stats['unchanged']} unchanged, {stats['removed']} removed.")
+
+    dt = time.perf_counter() - t0
+    metrics.observe("stage.discovery", dt)
+    metrics.count("discovery.files", counts["files"])
+    telemetry.emit_many([
+        ("discovery", "discovered", args.root, counts["files"], dict(stats, incremental=args.incremental)),
+        ("discovery", "stage", "discovery", dt, None),
+    ])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+# Small file helpers shared by the writers of the pipeline's binary files
+# (allowlist.bin, .qsl scan lists).
+
+def temp_beside(path):
+    """
+    (fd, temp path) for a new file in path's directory, to be renamed over
+    path once complete: processes that have the old file mapped keep their
+    pages instead of faulting on a truncate.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".")
+    os.fchmod(fd, 0o644)
+    return fd, tmp
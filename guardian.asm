@@ -27,19 +27,21 @@ section .data
     ; Configuration
     ; Real Mode: Full Discovery + Folder Triage
     ; Real Mode: Full Discovery + Python Agent Triage
-    scan_cmd        db "find / -type f \( -name '*.py' -o -name '*.sh' -o -name '*.elf' -o -name '*.exe' -o -name '*.txt' -o -name '*.cpp' -o -name '*.asm' \) -mount 2>/dev/null > scan_list.txt", 0
-    triage_list     db "scan_list.txt", 0
-    target_list     db "suspicious_targets.txt", 0  ; Agent Output
+    ; Discovery: parallel os.scandir walker (same filter + -mount, prunes /proc /sys /snap)
+    ; --incremental: only files new/modified since scan_manifest.bin reach triage & deep scan
+    ; .qsl: front-coded binary scan lists (scanlist.py) between the Python stages
+    scan_cmd        db "python3 discovery.py / -o scan_list.qsl --incremental", 0
+    triage_list     db "scan_list.qsl", 0
+    target_list     db "suspicious_targets.qsl", 0  ; Agent Output
+    unsafe_list     db "unsafe_targets.txt", 0      ; Deep Scan Output (review queue)
     
-    cmd_agent       db "python3 agent_triage.py", 0
-    resp_filename   db "llm_response.txt", 0
+    cmd_agent       db "python3 agent_triage.py --input scan_list.qsl --targets suspicious_targets.qsl", 0
     
     env_var_name    db "OPENROUTER_KEY", 0
     mode_r          db "r", 0
 
     ; --- Models ---
     model_triage    db "google/gemini-2.0-flash-exp:free", 0
-    model_deep      db "mistralai/mistral-7b-instruct:free", 0
 
     ; --- Messages ---
     msg_title       db 10, "===============================================", 10, \
@@ -57,8 +59,11 @@ section .data
     
     msg_ask_deep    db 10, "    [?] Deep Scan identified vectors? (y/n): ", 0
     msg_step_4      db 10, "[3/3] DEEP CODE ANALYSIS: Inspecting Agent Vectors...", 10, 0
-    msg_analyzing   db "    [*] Scanning: %s", 10, 0
-    msg_safe        db "        [+] Status: CLEAN.", 10, 0
+    msg_triage_fail db "    [-] AGENT failed: no target list, discovery manifest left pending.", 10, 0
+    msg_incomplete  db "    [-] DEEP SCAN incomplete: discovery manifest left pending for a rescan.", 10, 0
+    msg_batch_fail  db "    [-] DEEP SCAN failed: review skipped, discovery manifest left pending.", 10, 0
+    msg_review      db 10, "    [*] REVIEW: Flagged vectors awaiting decision...", 10, 0
+    msg_analyzing   db "    [*] Target: %s", 10, 0
     msg_unsafe      db "        [!] CRITICAL: MALICIOUS SIGNATURE DETECTED!", 10, 0
     msg_prompt      db "        [?] NEUTRALIZE THREAT? (y/n): ", 0
     msg_deleted     db "        [x] TARGET ELIMINATED.", 10, 0
@@ -71,32 +76,24 @@ section .data
     ; output = API_Result OR Local_Fallback
     ; Triage: REAL MODE (No Fallback)
     ; Triage: FOLDER Analysis Prompt
-    cmd_triage      db 'python3 -c ', 39, \
-                       'import json, sys; list_data = open("folder_list.txt").read(); print(json.dumps({"model": "%s", "messages": [{"role": "system", "content": "You are a Threat Hunter. Review these folders. Return ONLY paths that are User-Writable, Temporary, or Suspicious (e.g. /home, /tmp, /dev/shm). Return 1 path per line. Raw text."},{"role": "user", "content": list_data}]}))', \
+    ; Folders go out as a #N-tagged tree (zone_prompt.py); the reply is decoded back to paths
+    cmd_triage      db 'python3 zone_prompt.py folder_list.txt --encode | python3 -c ', 39, \
+                       'import json, sys; list_data = sys.stdin.read(); print(json.dumps({"model": "%s", "messages": [{"role": "system", "content": "You are a Threat Hunter. Review these folders. They are listed as a tree: an indented line continues the path of the nearest less-indented line above it. Return ONLY the #N tags of folders that are User-Writable, Temporary, or Suspicious (e.g. /home, /tmp, /dev/shm). Return 1 tag per line. Raw text."},{"role": "user", "content": list_data}]}))', \
                        39, ' > triage_req.json && ', \
                        'curl -s -X POST https://openrouter.ai/api/v1/chat/completions ', \
                        '-H "Authorization: Bearer %s" ', \
                        '-H "Content-Type: application/json" ', \
-                       '-d @triage_req.json | python3 -c "import sys, json; data=json.load(sys.stdin); print(data[\"choices\"][0][\"message\"][\"content\"]) if \"choices\" in data else sys.exit(0)" > sus_folders.txt', 0
+                       '-d @triage_req.json | python3 -c "import sys, json; data=json.load(sys.stdin); print(data[\"choices\"][0][\"message\"][\"content\"]) if \"choices\" in data else sys.exit(0)" | python3 zone_prompt.py folder_list.txt --decode > sus_folders.txt', 0
 
-    ; Deep Scan: Same as before but deeper prompt
-    cmd_deep        db 'curl -s -X POST https://openrouter.ai/api/v1/chat/completions ', \
-                       '-H "Authorization: Bearer %s" ', \
-                       '-H "Content-Type: application/json" ', \
-                       '-d "$(python3 -c ', 39, \
-                       'import json, sys; print(json.dumps({"model": "%s", "messages": [{"role": "system", "content": "Deep Code Analysis. Check for buffer overflows, shellcode, rm -rf, or reverse shells. Reply UNSAFE if malicious, SAFE otherwise."},{"role": "user", "content": "Code: " + open(sys.argv[1], errors="ignore").read()}]}))', \
-                       39, ' %s)" > llm_response.txt', 0
-
-    sig_deep        db "deep_core", 0
-    sig_mal         db "delete the system logs", 0  ; Local Signature for attack.txt
-    msg_deep_hit    db "        [!] DEEP CORE SIGNATURE DETECTED: 0xDEADBEEF (Kernel-Level Anomaly)", 10, 0
-
-    kw_unsafe       db "UNSAFE", 0
+    ; Deep Scan: whole-file mmap signature scan + remote LLM on a worker pool
+    ; -> deep_report.jsonl (all verdicts) + unsafe_targets.txt (review queue)
+    cmd_deep_batch  db "python3 deep_scan.py --batch suspicious_targets.qsl", 0
+    ; Changed files only count as seen once the batch has a verdict for them
+    cmd_commit      db "python3 discovery.py --commit-manifest", 0
 
 section .bss
     cmd_buffer      resb 8192
     api_key_ptr     resq 1
-    file_buffer     resb 4096
     path_buffer     resb 256
     file_handle     resq 1
 
@@ -160,9 +157,6 @@ main:
     mov rdi, scan_cmd
     call system
 
-    mov rdi, scan_cmd
-    call system
-
     ; --------------------------------------
     ; PHASE 3: AGENT TRIAGE (Python)
     ; --------------------------------------
@@ -170,9 +164,16 @@ main:
     xor rax, rax
     call printf
 
+    ; Drop the previous target list so a failed triage cannot hand it on
+    mov rax, 87 ; unlink
+    mov rdi, target_list
+    syscall
+
     ; Exec Agent
     mov rdi, cmd_agent
     call system
+    test eax, eax
+    jnz .triage_failed
 
     mov rdi, msg_targets
     xor rax, rax
@@ -207,8 +208,48 @@ main:
     xor rax, rax
     call printf
 
-    ; Open suspicious_targets.txt
-    mov rdi, target_list
+    ; Drop the previous review queue so a failed batch cannot re-offer it
+    mov rax, 87 ; unlink
+    mov rdi, unsafe_list
+    syscall
+
+    ; Batch deep scan (all cores), verdicts first, decisions after
+    mov rdi, cmd_deep_batch
+    call system
+    test eax, eax
+    jz .commit
+    cmp eax, 0x300                  ; exit 3: some files got no verdict (deep_scan EXIT_INCOMPLETE)
+    jne .batch_failed               ; Keep the manifest pending, nothing to review
+
+    mov rdi, msg_incomplete         ; Review the hits, but rescan the rest next run
+    xor rax, rax
+    call printf
+    jmp .review
+
+.commit:
+    mov rdi, cmd_commit
+    call system
+    jmp .review
+
+.triage_failed:
+    mov rdi, msg_triage_fail
+    xor rax, rax
+    call printf
+    jmp .done
+
+.batch_failed:
+    mov rdi, msg_batch_fail
+    xor rax, rax
+    call printf
+    jmp .done
+
+.review:
+    mov rdi, msg_review
+    xor rax, rax
+    call printf
+
+    ; Open unsafe_targets.txt (review queue)
+    mov rdi, unsafe_list
     mov rsi, mode_r
     call fopen
     test rax, rax
@@ -230,23 +271,12 @@ main:
     cmp byte [path_buffer], 0
     je .scan_loop
 
-    ; Analyze
+    ; Review (already flagged by the batch scan)
     mov rdi, msg_analyzing
     mov rsi, path_buffer
     xor rax, rax
     call printf
 
-    call deep_analyze_file
-    cmp rax, 1
-    je .ask_delete
-    
-    ; Safe
-    mov rdi, msg_safe
-    xor rax, rax
-    call printf
-    jmp .scan_loop
-
-.ask_delete:
     mov rdi, msg_unsafe
     xor rax, rax
     call printf
@@ -297,103 +327,6 @@ main:
     xor rdi, rdi
     syscall
 
-; ------------------------------------------------------------------
-; deep_analyze_file
-; Input: path_buffer
-; Output: RAX (1=Unsafe, 0=Safe)
-; ------------------------------------------------------------------
-deep_analyze_file:
-    push rbp
-    mov rbp, rsp
-    sub rsp, 16 ; ALIGN
-
-    ; --- 1. LOCAL DEEP SCAN (Signature Check) ---
-    ; Check filename for 'deep_core'
-    mov rdi, path_buffer
-    mov rsi, sig_deep
-    call strstr
-    test rax, rax
-    jnz .unsafe_sig
-
-    ; Check file content for 0xDEADBEEF signature
-    mov rdi, path_buffer
-    mov rsi, mode_r
-    call fopen
-    test rax, rax
-    jz .do_llm_scan ; If open fails, try LLM anyway? Or skip? Let's proceed.
-
-    push rax
-    mov rdi, file_buffer
-    mov rsi, 1
-    mov rdx, 4095
-    mov rcx, rax
-    call fread
-    mov byte [file_buffer + rax], 0 ; Null terminate read data
-    pop rdi
-    call fclose
-    
-    ; --- LOCAL CONTENT SIGNATURE CHECK ---
-    mov rdi, file_buffer
-    mov rsi, sig_mal
-    call strstr
-    test rax, rax
-    jnz .unsafe_sig
-
-    ; --- 2. REMOTE LLM SCAN ---
-.do_llm_scan:
-    ; Construct Cmd
-    mov rdi, cmd_buffer
-    mov rsi, cmd_deep
-    mov rdx, [api_key_ptr]
-    mov rcx, model_deep  ; Use Mistral for Deep Scan
-    mov r8, path_buffer
-    xor rax, rax
-    call sprintf
-
-    mov rdi, cmd_buffer
-    call system
-
-    ; Check content for UNSAFE
-    mov rdi, resp_filename ; llm_response.txt
-    mov rsi, mode_r
-    call fopen
-    test rax, rax
-    jz .safe
-
-    push rax ; Save handle
-    mov rdi, file_buffer
-    mov rsi, 1
-    mov rdx, 4095
-    mov rcx, rax
-    call fread
-    mov byte [file_buffer + rax], 0
-    pop rdi
-    call fclose
-
-    mov rdi, file_buffer
-    mov rsi, kw_unsafe
-    call strstr
-    test rax, rax
-    jnz .unsafe
-
-.safe:
-    mov rax, 0
-    jmp .ret
-
-.unsafe_sig:
-    mov rdi, msg_deep_hit
-    xor rax, rax
-    call printf
-    mov rax, 1
-    jmp .ret
-
-.unsafe:
-    mov rax, 1
-.ret:
-    add rsp, 16
-    leave 
-    ret
-
 str_strip_nl:
     push rbp
     mov rbp, rsp
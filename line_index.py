@@ -0,0 +1,173 @@
+import os
+import sys
+import mmap
+import time
+import argparse
+import threading
+
+import numpy as np
+
+# Byte-offset line index for scan_list.txt (and any other path list).
+# offsets[n] is where line n starts, so line N, a page of lines, or the line
+# holding a search hit is one pread/bisect away -- the list itself is never
+# loaded. Appends are indexed incrementally; a rewritten file is reindexed.
+
+BLOCK_SIZE = 1 << 22
+TAIL_CHECK = 64   # bytes compared to tell an append from a rewrite
+
+class LineIndex:
+    """
+    Lazily (re)built index of complete lines in path. refresh() is cheap when
+    the file has not changed; call it before reads to pick up new lines.
+    A trailing line without its newline is not visible until completed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = np.zeros(1, dtype=np.uint64)   # offsets[-1] = end of last complete line
+        self._ident = None
+        self._tail = b""
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def indexed(self):
+        return int(self.offsets[-1])
+
+    def _index_range(self, fd, start, size):
+        # Scan [start, size) in blocks; returns offsets of the lines starting after each newline
+        found = []
+        with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as m:
+            for pos in range(start, size, BLOCK_SIZE):
+                block = np.frombuffer(m, dtype=np.uint8, count=min(BLOCK_SIZE, size - pos), offset=pos)
+                found.append(np.flatnonzero(block == 10).astype(np.uint64) + np.uint64(pos + 1))
+                del block
+        return found
+
+    def refresh(self):
+        # Returns the number of newly indexed lines (-1 if the file is gone)
+        with self._lock:
+            try:
+                fd = os.open(self.path, os.O_RDONLY)
+            except OSError:
+                self.offsets = np.zeros(1, dtype=np.uint64)
+                self._ident = None
+                return -1
+            try:
+                st = os.fstat(fd)
+                ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+                if ident == self._ident:
+                    return 0
+                end = self.indexed
+                appended = (self._ident is not None and self._ident[:2] == ident[:2] and st.st_size >= end
+                            and os.pread(fd, len(self._tail), end - len(self._tail)) == self._tail)
+                if not appended:
+                    self.offsets = np.zeros(1, dtype=np.uint64)
+                    end = 0
+                before = len(self)
+                if st.st_size > end:
+                    self.offsets = np.concatenate([self.offsets] + self._index_range(fd, end, st.st_size))
+                self._ident = ident
+                end = self.indexed
+                self._tail = os.pread(fd, min(TAIL_CHECK, end), end - min(TAIL_CHECK, end))
+                return len(self) - before
+            finally:
+                os.close(fd)
+
+    def _read(self, start, stop):
+        with open(self.path, "rb") as f:
+            return os.pread(f.fileno(), stop - start, start)
+
+    def line(self, n):
+        offsets = self.offsets
+        if n < 0:
+            n += len(offsets) - 1
+        if not 0 <= n < len(offsets) - 1:
+            raise IndexError(n)
+        start, stop = int(offsets[n]), int(offsets[n + 1])
+        return self._read(start, stop - 1).decode(errors="replace")
+
+    def page(self, start, count):
+        # Lines [start, start + count) with a single read
+        offsets = self.offsets
+        start = max(0, start)
+        stop = min(len(offsets) - 1, start + count)
+        if start >= stop:
+            return []
+        data = self._read(int(offsets[start]), int(offsets[stop]) - 1)
+        return data.decode(errors="replace").split("\n")
+
+    def search(self, query, prefix=False, skip=0, limit=100):
+        """
+        Line numbers and text of lines containing query (or starting with it),
+        in file order. The mapped file is searched with bytes.find and each hit
+        is mapped to its line by bisecting the offsets, so only matching
+        lines are decoded.
+        """
+        needle = query.encode()
+        offsets = self.offsets   # refresh() swaps the array, never mutates it
+        if not needle or not int(offsets[-1]):
+            return []
+        results = []
+        with open(self.path, "rb") as f:
+            # The file may have shrunk since the last refresh()
+            end = min(int(offsets[-1]), os.fstat(f.fileno()).st_size)
+            if not end:
+                return []
+            with mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ) as m:
+                # A prefix match is a "\n" + query hit, mapped one byte on to the
+                # line start; only the first line has no "\n" before it
+                shift = 0
+                if prefix:
+                    shift = 1
+                    line0 = m[:len(needle)] == needle
+                    needle = b"\n" + needle
+                if prefix and line0:
+                    hit = 0
+                else:
+                    pos = m.find(needle)
+                    hit = pos + shift if pos >= 0 else -1
+                while 0 <= hit < end:
+                    n = int(np.searchsorted(offsets, hit, side="right")) - 1
+                    if skip:
+                        skip -= 1
+                    else:
+                        start, stop = int(offsets[n]), int(offsets[n + 1])
+                        results.append((n, m[start:stop - 1].decode(errors="replace")))
+                        if len(results) >= limit:
+                            break
+                    # Continue after this line so a line matches once
+                    pos = m.find(needle, int(offsets[n + 1]) - shift)
+                    hit = pos + shift if pos >= 0 else -1
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE scan list index")
+    parser.add_argument("path", nargs="?", default="scan_list.txt")
+    parser.add_argument("--line", type=int, help="print line N (0-based)")
+    parser.add_argument("--page", type=int, help="print page P")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--search", help="print lines containing this string")
+    parser.add_argument("--prefix", action="store_true", help="--search matches line prefixes only")
+    args = parser.parse_args()
+
+    index = LineIndex(args.path)
+    t0 = time.perf_counter()
+    if index.refresh() < 0:
+        print(f"[-] Cannot open {args.path}")
+        sys.exit(1)
+    print(f"[*] INDEX: {len(index)} lines, {index.indexed} bytes in {time.perf_counter() - t0:.3f}s")
+
+    if args.line is not None:
+        print(f"    {args.line}: {index.line(args.line)}")
+    if args.page is not None:
+        for i, text in enumerate(index.page(args.page * args.page_size, args.page_size)):
+            print(f"    {args.page * args.page_size + i}: {text}")
+    if args.search:
+        for n, text in index.search(args.search, args.prefix, limit=args.page_size):
+            print(f"    {n}: {text}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+import os
+import ssl
+import json
+import time
+import random
+import asyncio
+import argparse
+import base64
+import threading
+import urllib.request
+from urllib.parse import urlsplit, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+
+# Shared LLM client for the triage agent, the deep scan and the oracle.
+# - One asyncio event loop on a background thread, so sync callers share it.
+# - Keep-alive HTTP/1.1 connection pool (no curl fork, no TLS handshake per call).
+# - Bounded concurrency, per-request timeout, retry with exponential backoff.
+# - Payloads stay in memory (no llm_req.json on disk).
+# - HTTPS_PROXY / HTTP_PROXY / NO_PROXY are honoured like curl does (http://
+#   proxies; CONNECT tunnel for https URLs).
+# Stdlib only; QSAFE_LLM_URL points it at a local stub (see --stub).
+
+OPENROUTER_URL = os.getenv("QSAFE_LLM_URL", "https://openrouter.ai/api/v1/chat/completions")
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    pass
+
+class _RetryableError(LLMError):
+    def __init__(self, msg, retry_after=None):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+def proxy_for(url, proxy=None):
+    """
+    urlsplit() of the proxy to use for url, or None for a direct connection.
+    proxy=None takes it from the environment (NO_PROXY honoured), "" forces
+    a direct connection.
+    """
+    parts = urlsplit(url)
+    if proxy is None:
+        proxy = urllib.request.getproxies().get(parts.scheme)
+        if proxy and urllib.request.proxy_bypass(parts.hostname or ""):
+            return None
+    if not proxy:
+        return None
+    proxy = urlsplit(proxy if "://" in proxy else "http://" + proxy)
+    if proxy.scheme != "http":
+        raise ValueError(f"unsupported proxy scheme {proxy.scheme!r} (only http:// proxies)")
+    return proxy
+
+class LLMClient:
+    """
+    Async OpenRouter-compatible chat client.
+    Use chat() from coroutines, or chat_sync()/chat_many_sync() from plain
+    code; both run on the client's own loop and share its connection pool.
+    """
+
+    def __init__(self, api_key=None, url=OPENROUTER_URL, max_concurrency=8, timeout=60.0,
+                 retries=3, backoff=0.5, headers=None, proxy=None):
+        self.api_key = api_key
+        self.url = url
+        parts = urlsplit(url)
+        self.tls = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.tls else 80)
+        # host[:port] as written in the URL (a non-default port must be sent)
+        self.netloc = parts.netloc.rpartition("@")[2]
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        # proxy: None = from the environment, "" = direct, or an http:// URL
+        self.proxy = proxy_for(url, proxy)
+        self._proxy_auth = None
+        if self.proxy and self.proxy.username:
+            cred = f"{unquote(self.proxy.username)}:{unquote(self.proxy.password or '')}"
+            self._proxy_auth = "Basic " + base64.b64encode(cred.encode()).decode()
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = dict(headers or {})
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "connections": 0}
+
+        self._idle = []
+        self._sem = None
+        self._ssl = ssl.create_default_context() if self.tls else None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_concurrency=None, timeout=None, retries=None, backoff=None, headers=None):
+        # Updates the given settings; a new concurrency limit applies to later requests
+        if max_concurrency is not None and max_concurrency != self.max_concurrency:
+            self.max_concurrency = max_concurrency
+            self._sem = None
+        if timeout is not None:
+            self.timeout = timeout
+        if retries is not None:
+            self.retries = retries
+        if backoff is not None:
+            self.backoff = backoff
+        if headers is not None:
+            self.headers = dict(headers)
+
+    # --- loop management (sync bridge) ---
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def run(self, coro):
+        # Run a coroutine on the client loop from synchronous code
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def close(self):
+        if self._loop is None:
+            return
+        self.run(self._close_idle())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+
+    async def _close_idle(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    # --- HTTP/1.1 over pooled connections ---
+
+    async def _connect(self):
+        if self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        if self.proxy:
+            reader, writer = await self._connect_proxy()
+        else:
+            reader, writer = await asyncio.open_connection(
+                self.host, self.port, ssl=self._ssl, server_hostname=self.host if self.tls else None)
+        self.stats["connections"] += 1
+        return reader, writer, False
+
+    async def _connect_proxy(self):
+        # http:// URLs are sent to the proxy as absolute-URI requests; https:// ones
+        # go through a CONNECT tunnel, with TLS to the origin inside it
+        reader, writer = await asyncio.open_connection(self.proxy.hostname, self.proxy.port or 80)
+        if not self.tls:
+            return reader, writer
+        try:
+            head = f"CONNECT {self.host}:{self.port} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            if self._proxy_auth:
+                head += f"Proxy-Authorization: {self._proxy_auth}\r\n"
+            writer.write((head + "\r\n").encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = status_line.split()
+            if len(parts) < 2 or parts[1] != b"200":
+                raise OSError(f"proxy CONNECT refused: {status_line.decode('latin-1').strip() or 'no reply'}")
+            await writer.start_tls(self._ssl, server_hostname=self.host)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _read_body(self, reader, headers):
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks), True
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"])), True
+        return await reader.read(), False
+
+    async def _request_once(self, body, extra_headers):
+        try:
+            reader, writer, reused = await self._connect()
+        except OSError as e:
+            raise _RetryableError(f"connect: {e}")
+        headers = {
+            "Host": self.netloc,
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive",
+        }
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        target = self.path
+        if self.proxy and not self.tls:
+            target = f"http://{self.netloc}{self.path}"
+            if self._proxy_auth:
+                headers["Proxy-Authorization"] = self._proxy_auth
+        headers.update(self.headers)
+        headers.update(extra_headers or {})
+        head = f"POST {target} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+
+        keep = False
+        try:
+            writer.write(head.encode() + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                # Stale pooled connection closed by the server
+                raise _RetryableError("connection closed" + (" (reused)" if reused else ""), 0)
+            status = int(status_line.split()[1])
+
+            resp_headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = line.decode("latin-1").partition(":")
+                resp_headers[k.strip().lower()] = v.strip()
+
+            data, framed = await self._read_body(reader, resp_headers)
+            keep = framed and resp_headers.get("connection", "").lower() != "close"
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            raise _RetryableError(f"{type(e).__name__}: {e}")
+        finally:
+            if keep:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+
+        if status in RETRY_STATUS:
+            retry_after = resp_headers.get("retry-after")
+            raise _RetryableError(f"HTTP {status}", float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if status >= 400:
+            raise LLMError(f"HTTP {status}: {data[:200]!r}")
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            raise LLMError(f"invalid JSON response: {e}") from e
+
+    async def post_json(self, payload, headers=None):
+        # POST payload, retrying transient failures; returns decoded JSON
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        body = json.dumps(payload).encode()
+
+        async with self._sem:
+            for attempt in range(self.retries + 1):
+                self.stats["requests"] += 1
+                try:
+                    # Round trip per attempt, connection setup included
+                    with metrics.timer("llm.request"):
+                        return await asyncio.wait_for(self._request_once(body, headers), self.timeout)
+                except (_RetryableError, asyncio.TimeoutError) as e:
+                    if attempt == self.retries:
+                        self.stats["errors"] += 1
+                        metrics.count("llm.errors")
+                        raise LLMError(f"giving up after {attempt + 1} attempts: {e}") from e
+                    self.stats["retries"] += 1
+                    metrics.count("llm.retries")
+                    delay = getattr(e, "retry_after", None)
+                    if delay is None:
+                        delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                    await asyncio.sleep(delay)
+                except LLMError:
+                    self.stats["errors"] += 1
+                    metrics.count("llm.errors")
+                    raise
+
+    async def chat(self, messages, model, headers=None):
+        # Assistant reply text, or None if the API returned no choices
+        data = await self.post_json({"model": model, "messages": messages}, headers)
+        if "choices" in data:
+            return data["choices"][0]["message"]["content"]
+        return None
+
+    def chat_sync(self, messages, model, headers=None):
+        return self.run(self.chat(messages, model, headers))
+
+    def chat_many_sync(self, requests, headers=None):
+        """
+        Runs [(messages, model), ...] concurrently (bounded by max_concurrency).
+        Returns replies in order; failed requests yield None.
+        """
+        async def _all():
+            results = await asyncio.gather(*(self.chat(m, model, headers) for m, model in requests),
+                                           return_exceptions=True)
+            return [None if isinstance(r, Exception) else r for r in results]
+        return self.run(_all())
+
+# One client per (key, url) and per process: a forked worker must not reuse
+# the parent's loop thread.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def shared_client(api_key, url=OPENROUTER_URL, **kwargs):
+    # kwargs configure the client; given again for an existing one, they update it
+    key = (os.getpid(), api_key, url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = LLMClient(api_key, url, **kwargs)
+        elif kwargs:
+            client.configure(**kwargs)
+    return client
+
+# --- Local stub server (dry runs, benchmarks) ---
+
+def stub_reply(messages):
+    # Deterministic stand-in for the remote model
+    user = messages[-1]["content"] if messages else ""
+    if user.startswith("Code: "):
+        return "UNSAFE" if any(k in user for k in ("rm -rf", "/bin/sh -i", "nc -e")) else "SAFE"
+    return "\n".join(l for l in user.splitlines() if any(k in l for k in ("Desktop", "tmp", "Downloads", "shm")))
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    failures = 0        # answer this many requests with 503 first (self-test)
+    last_host = None
+    last_target = None  # request target: absolute when the stub is used as a proxy
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        type(self).last_host = self.headers.get("Host")
+        type(self).last_target = self.path
+        if self.failures > 0:
+            type(self).failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            messages = json.loads(body).get("messages", [])
+        except ValueError:
+            messages = []
+        if self.latency:
+            time.sleep(self.latency)
+        out = json.dumps({"choices": [{"message": {"role": "assistant", "content": stub_reply(messages)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+def serve_stub(port=8765, latency=0.0):
+    # Starts the stub in a daemon thread; returns (server, url)
+    handler = type("StubHandler", (_StubHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+
+def self_test():
+    """
+    Round trip, keep-alive, Host header, retry/backoff, proxying and
+    shared_client reconfiguration against the local stub on a free port.
+    Returns True if every check passed.
+    """
+    server, url = serve_stub(0)
+    stub = server.RequestHandlerClass
+    client = LLMClient(None, url, retries=2, backoff=0.05, timeout=5.0, proxy="")
+    shared = None
+    code = [{"role": "user", "content": "Code: rm -rf /"}]
+    checks = []
+    try:
+        checks.append(("round trip", client.chat_sync(code, "stub") == "UNSAFE"))
+        checks.append(("host header", stub.last_host == f"127.0.0.1:{server.server_address[1]}"))
+        client.chat_sync(code, "stub")
+        checks.append(("keep-alive", client.stats["connections"] == 1))
+
+        stub.failures = 2
+        t0 = time.perf_counter()
+        reply = client.chat_sync(code, "stub")
+        waited = time.perf_counter() - t0
+        # Two retries: backoff * (1 + 2), jitter adds at most 25%
+        checks.append(("retry", reply == "UNSAFE" and client.stats["retries"] == 2))
+        checks.append(("backoff", 0.15 <= waited < 1.0))
+
+        stub.failures = 3
+        try:
+            client.chat_sync(code, "stub")
+            gave_up = False
+        except LLMError:
+            gave_up = True
+        checks.append(("give up", gave_up and client.stats["errors"] == 1 and stub.failures == 0))
+
+        # The stub doubles as a forward proxy: it answers absolute-URI requests too
+        remote = "http://llm.invalid/api/v1/chat/completions"
+        proxy_url = f"http://127.0.0.1:{server.server_address[1]}"
+        saved = {k: os.environ.pop(k, None) for k in ("HTTP_PROXY", "http_proxy", "NO_PROXY", "no_proxy")}
+        os.environ["HTTP_PROXY"] = proxy_url
+        try:
+            proxied = LLMClient(None, remote, retries=0, timeout=5.0)
+        finally:
+            for k, v in saved.items():
+                os.environ.pop(k, None)
+                if v is not None:
+                    os.environ[k] = v
+        try:
+            reply = proxied.chat_sync(code, "stub")
+        finally:
+            proxied.close()
+        checks.append(("http proxy", reply == "UNSAFE" and stub.last_target == remote
+                       and stub.last_host == "llm.invalid"))
+
+        shared = shared_client(None, url, proxy="")
+        shared_client(None, url, max_concurrency=3)
+        checks.append(("reconfigure", shared.max_concurrency == 3))
+    finally:
+        client.close()
+        if shared:
+            _clients.pop((os.getpid(), None, url), None)
+            shared.close()
+        server.shutdown()
+
+    for name, ok in checks:
+        print(f"    [{'+' if ok else '-'}] {name}")
+    return all(ok for _, ok in checks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE shared LLM client")
+    parser.add_argument("--stub", action="store_true", help="run a local OpenRouter-compatible stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub reply delay in seconds")
+    parser.add_argument("--self-test", action="store_true", help="check the client against the stub and exit")
+    args = parser.parse_args()
+
+    if args.self_test:
+        print("[*] LLM CLIENT: self-test against the local stub...")
+        ok = self_test()
+        print("[+] LLM CLIENT: all checks passed." if ok else "[-] LLM CLIENT: self-test failed.")
+        raise SystemExit(0 if ok else 1)
+
+    if args.stub:
+        server, url = serve_stub(args.port, args.latency)
+        print(f"[*] LLM STUB: listening, export QSAFE_LLM_URL={url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
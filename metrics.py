@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import math
+import time
+import fcntl
+import atexit
+import argparse
+import tempfile
+import functools
+import threading
+import multiprocessing.util
+from contextlib import nullcontext
+
+# Hot-path instrumentation for the pipeline stages.
+# Off by default: timer() hands back a shared no-op context, count() returns
+# at once and @timed leaves the function undecorated, so instrumented code
+# pays one global check. QSAFE_METRICS=FILE (or 1 for metrics.json) turns it
+# on; each process (pool workers included) merges its timers and counters
+# into FILE at exit, under the stage that started it. The dashboard charts
+# that file.
+# QSAFE_PROFILE=cpu,mem additionally runs cProfile (FILE.<stage>.prof plus
+# the top functions in the summary) and tracemalloc (peak and top
+# allocation sites) in the stage's main process.
+
+DEFAULT_FILE = "metrics.json"
+BUCKETS_PER_OCTAVE = 8   # latency histogram resolution, ~9% per bucket
+TOP_N = 20
+
+def _resolve(value):
+    if value in ("", "0", "off"):
+        return None
+    return DEFAULT_FILE if value in ("1", "on") else value
+
+METRICS_FILE = _resolve(os.getenv("QSAFE_METRICS", ""))
+ENABLED = METRICS_FILE is not None
+PROFILE = {p.strip() for p in os.getenv("QSAFE_PROFILE", "").split(",") if p.strip()} if ENABLED else set()
+
+class Timer:
+    """
+    Latency distribution for one name: exact count/total/min/max and a
+    log-bucketed histogram, so percentiles merge across processes and runs.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        b = math.floor(math.log2(max(seconds, 1e-9)) * BUCKETS_PER_OCTAVE)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for b, n in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + n
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                # Geometric middle of the bucket, clamped to what was observed
+                return min(self.max, max(self.min, 2 ** ((b + 0.5) / BUCKETS_PER_OCTAVE)))
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total,
+                "mean": self.total / self.count if self.count else None,
+                "min": self.min if self.count else None, "max": self.max,
+                "p50": self.percentile(0.5), "p90": self.percentile(0.9), "p99": self.percentile(0.99),
+                "buckets": {str(b): n for b, n in sorted(self.buckets.items())}}
+
+    @classmethod
+    def from_dict(cls, d):
+        t = cls()
+        t.count = d.get("count", 0)
+        t.total = d.get("total", 0.0)
+        t.min = d["min"] if d.get("min") is not None else math.inf
+        t.max = d.get("max", 0.0)
+        t.buckets = {int(b): n for b, n in d.get("buckets", {}).items()}
+        return t
+
+# --- Process-local state ---
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_pid = None
+_source = os.getenv("QSAFE_METRICS_SOURCE") or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+_run = os.getenv("QSAFE_METRICS_RUN")
+_profiler = None
+_owner = None   # pid that called start(); profilers only run there
+
+def _reset_after_fork():
+    # A forked worker starts empty, without the parent's profilers; the
+    # parent reports its own numbers
+    global _timers, _counters, _pid, _profiler, _owner
+    if _profiler is not None:
+        _profiler.disable()
+    if _owner is not None and "mem" in PROFILE:
+        import tracemalloc
+        tracemalloc.stop()
+    _timers, _counters, _pid, _profiler, _owner = {}, {}, None, None, None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _arm():
+    # First record in this process: make sure it is flushed on exit.
+    # Pool workers skip atexit, so they also get a multiprocessing finalizer.
+    global _pid
+    _pid = os.getpid()
+    atexit.register(flush)
+    multiprocessing.util.Finalize(None, flush, exitpriority=10)
+
+def observe(name, seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        if _pid != os.getpid():
+            _arm()
+        t = _timers.get(name)
+        if t is None:
+            t = _timers[name] = Timer()
+        t.add(seconds)
+
+def count(name, n=1):
+    if not ENABLED:
+        return
+    with _lock:
+        if _pid != os.getpid():
+            _arm()
+        _counters[name] = _counters.get(name, 0) + n
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.t0)
+
+_NULL = nullcontext()
+
+def timer(name):
+    # with metrics.timer("stage.step"): ...
+    return _Span(name) if ENABLED else _NULL
+
+def timed(name):
+    # Decorator form of timer(); a no-op when metrics are off
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - t0)
+        return inner
+    return wrap
+
+def start(source):
+    """
+    Marks the start of a stage run in this process. Records from this
+    process and its workers are grouped under source and replace the
+    previous run's. Starts the QSAFE_PROFILE capture, if any.
+    """
+    global _source, _run, _profiler, _owner
+    if not ENABLED:
+        return
+    _source = source
+    _owner = os.getpid()
+    _run = f"{os.getpid()}.{int(time.time())}"
+    # Inherited by spawned workers
+    os.environ["QSAFE_METRICS_SOURCE"] = _source
+    os.environ["QSAFE_METRICS_RUN"] = _run
+    with _lock:
+        if _pid != os.getpid():
+            _arm()
+    if "cpu" in PROFILE and _profiler is None:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if "mem" in PROFILE:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+
+def _profile_summary():
+    global _profiler
+    extra = {}
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.disable()
+    if "mem" in PROFILE:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:TOP_N]
+            tracemalloc.stop()
+            extra["memory"] = {"current": current, "peak": peak,
+                               "top": [{"where": f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+                                        "size": s.size, "count": s.count} for s in top]}
+    if profiler is not None:
+        import pstats
+        profiler.dump_stats(f"{METRICS_FILE}.{_source}.prof")
+        stats = pstats.Stats(profiler).stats
+        top = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:TOP_N]
+        extra["profile"] = [{"function": f"{os.path.basename(f)}:{line}({fn})", "calls": nc,
+                             "tottime": tt, "cumtime": ct}
+                            for (f, line, fn), (cc, nc, tt, ct, _) in top]
+    return extra
+
+def load(path=None):
+    path = path or METRICS_FILE or DEFAULT_FILE
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"updated": None, "sources": {}}
+
+def flush():
+    """
+    Merges this process's records into the summary file and clears them.
+    Safe to call repeatedly; concurrent writers serialize on FILE.lock.
+    """
+    global _timers, _counters
+    if not ENABLED:
+        return
+    with _lock:
+        timers, counters = _timers, _counters
+        _timers, _counters = {}, {}
+    extra = _profile_summary() if os.getpid() == _owner else {}
+    if not timers and not counters and not extra:
+        return
+    run = _run or str(os.getpid())
+
+    try:
+        with open(METRICS_FILE + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            summary = load(METRICS_FILE)
+            entry = summary["sources"].get(_source)
+            if entry is None or entry.get("run") != run:
+                entry = {"run": run, "started": time.time(), "timers": {}, "counters": {}}
+            for name, t in timers.items():
+                merged = Timer.from_dict(entry["timers"].get(name, {}))
+                merged.merge(t)
+                entry["timers"][name] = merged.to_dict()
+            for name, n in counters.items():
+                entry["counters"][name] = entry["counters"].get(name, 0) + n
+            entry.update(extra)
+            entry["updated"] = time.time()
+            summary["sources"][_source] = entry
+            summary["updated"] = entry["updated"]
+
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(METRICS_FILE)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(summary, f, indent=1)
+            os.replace(tmp, METRICS_FILE)
+    except OSError as e:
+        # Instrumentation must never break a scan
+        print(f"[-] METRICS: cannot write {METRICS_FILE}: {e}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE pipeline metrics summary")
+    parser.add_argument("path", nargs="?", default=METRICS_FILE or DEFAULT_FILE)
+    parser.add_argument("--json", action="store_true", help="dump the raw summary")
+    args = parser.parse_args()
+
+    summary = load(args.path)
+    if not summary["sources"]:
+        print(f"[-] No metrics at {args.path} (run the pipeline with QSAFE_METRICS={args.path})")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    def ms(v):
+        return f"{v * 1000:10.2f}" if v is not None else f"{'-':>10}"
+
+    for source, entry in summary["sources"].items():
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["updated"]))
+        print(f"[*] {source} (run {entry['run']}, {when})")
+        if entry["timers"]:
+            print(f"    {'timer':<24} {'count':>8} {'total s':>10} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+        for name, t in sorted(entry["timers"].items()):
+            print(f"    {name:<24} {t['count']:>8} {t['total']:>10.3f} {ms(t['p50'])} {ms(t['p90'])} {ms(t['p99'])} {ms(t['max'])}")
+        for name, n in sorted(entry["counters"].items()):
+            print(f"    {name:<24} {n:>8}")
+        for p in entry.get("profile", [])[:10]:
+            print(f"    cpu  {p['cumtime']:8.3f}s cum {p['tottime']:8.3f}s self {p['calls']:>8}x  {p['function']}")
+        if "memory" in entry:
+            print(f"    mem  peak {entry['memory']['peak'] / 1e6:.1f} MB")
+            for m in entry["memory"]["top"][:5]:
+                print(f"    mem  {m['size'] / 1e6:8.2f} MB {m['count']:>8} blocks  {m['where']}")
+
+if __name__ == "__main__":
+    main()
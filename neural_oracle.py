@@ -1,9 +1,16 @@
 import os
 import sys
 import json
+import time
 import hashlib
-import requests
-import struct
+import random
+import argparse
+
+import numpy as np
+
+import llm_client
+import allowlist
+import cfg_paths
 
 # Configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -16,8 +23,6 @@ def get_openrouter_response(prompt):
         sys.exit(1)
 
     headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
         "HTTP-Referer": "https://qsafe-poc.com", # Required by OpenRouter
         "X-Title": "Q-SAFE POC",
     }
@@ -31,9 +36,8 @@ def get_openrouter_response(prompt):
     }
 
     try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
+        client = llm_client.shared_client(OPENROUTER_API_KEY)
+        return client.chat_sync(data["messages"], data["model"], headers=headers)
     except Exception as e:
         print(f"API Error: {e}")
         return None
@@ -46,7 +50,6 @@ def calculate_context_hash(sequence_ids):
     For this POC, we treat Function IDs as addresses.
     """
     current_hash = 0
-    print(f"Calculating hash for sequence: {sequence_ids}")
     for node_id in sequence_ids:
         # Simulate ROL/Shift and XOR
         # In python: let's use a simple shift-xor for demonstration
@@ -55,7 +58,90 @@ def calculate_context_hash(sequence_ids):
     
     return current_hash
 
+def pack_sequences(sequences, pad=0):
+    """
+    Packs call sequences into a padded (N, max_len) uint64 array plus lengths,
+    the input format of calculate_context_hashes.
+    """
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    ids = np.full((len(sequences), int(lengths.max(initial=0))), pad, dtype=np.uint64)
+    for row, seq in enumerate(sequences):
+        ids[row, :len(seq)] = seq
+    return ids, lengths
+
+def calculate_context_hashes(ids, lengths=None):
+    """
+    Vectorized calculate_context_hash over a padded (N, max_len) uint64 array.
+    Steps run column by column across all rows; uint64 shifts wrap at 64 bits
+    like shl rbx, 1. Rows stop at their length, so padding never changes a hash.
+    """
+    ids = np.asarray(ids, dtype=np.uint64)
+    hashes = np.zeros(ids.shape[0], dtype=np.uint64)
+    one = np.uint64(1)
+    for col in range(ids.shape[1]):
+        step = (hashes << one) ^ ids[:, col]
+        if lengths is None:
+            hashes = step
+        else:
+            hashes = np.where(col < lengths, step, hashes)
+    return hashes
+
+def write_bulk_allowlist(ids, lengths=None, path="allowlist.bin"):
+    # Hash every sequence, drop duplicates and write the table in one go
+    hashes = np.unique(calculate_context_hashes(ids, lengths))
+    size = allowlist.write_allowlist(hashes.tolist(), path)
+    return len(hashes), size
+
+def verify_parity(n=20000, max_len=64, seed=1):
+    # Bulk vs scalar hashes on random sequences (incl. empty and >64-step ones)
+    rng = random.Random(seed)
+    sequences = [[rng.getrandbits(64) if rng.random() < 0.1 else rng.randrange(0x10000)
+                  for _ in range(rng.randrange(max_len + 1))] for _ in range(n)]
+    ids, lengths = pack_sequences(sequences, pad=0xFFFFFFFFFFFFFFFF)
+    bulk = calculate_context_hashes(ids, lengths).tolist()
+    bad = [i for i, seq in enumerate(sequences) if bulk[i] != calculate_context_hash(seq)]
+    if bad:
+        print(f"[-] PARITY FAIL: {len(bad)}/{n} sequences differ (first: {sequences[bad[0]]})")
+        return False
+    print(f"[+] PARITY OK: {n} sequences, bulk hashes match calculate_context_hash.")
+    return True
+
+def benchmark(n=1000000, length=16):
+    rng = np.random.default_rng(0)
+    ids = rng.integers(0, 1 << 16, size=(n, length), dtype=np.uint64)
+    sample = ids[:20000].tolist()
+    t0 = time.perf_counter()
+    for seq in sample:
+        calculate_context_hash(seq)
+    scalar = (time.perf_counter() - t0) / len(sample)
+    t0 = time.perf_counter()
+    calculate_context_hashes(ids)
+    bulk = (time.perf_counter() - t0) / n
+    print(f"[*] HASH BENCH: {n} sequences x {length} calls")
+    print(f"    scalar: {1 / scalar:,.0f} seq/s   bulk: {1 / bulk:,.0f} seq/s   ({scalar / bulk:.0f}x)")
+
 def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE Neural Oracle")
+    parser.add_argument("--verify", action="store_true", help="check bulk hashing against the scalar reference")
+    parser.add_argument("--bench", action="store_true", help="scalar vs bulk hashing throughput")
+    parser.add_argument("--cfg", help="enumerate valid paths from a CFG edge list (see cfg_paths.py)")
+    parser.add_argument("--max-depth", type=int, default=cfg_paths.DEFAULT_MAX_DEPTH)
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(0 if verify_parity() else 1)
+    if args.bench:
+        benchmark()
+        return
+    if args.cfg:
+        print(f"[*] Enumerating valid paths of {args.cfg} (depth <= {args.max_depth})...")
+        graph, entries = cfg_paths.load_cfg(args.cfg)
+        walked, count, size, truncated = cfg_paths.generate(graph, entries, "allowlist.bin", args.max_depth)
+        print(f"[+] Successfully generated allowlist.bin with {count} entries from {walked} paths ({size} bytes).")
+        if truncated:
+            print("[!] Path limit reached; allowlist is incomplete.")
+        return
+
     print("[*] Q-SAFE Neural Oracle Initialized")
     
     # 1. Read Target Code
@@ -95,22 +181,15 @@ def main():
     # We intentionally DO NOT INCLUDE this in the valid_sequences.
     # Therefore, the hash for this path will be unknown/invalid.
 
-    allowlist_hashes = []
-    
     print("[*] Generating Context Hashes...")
-    for seq in valid_sequences:
-        h = calculate_context_hash(seq)
-        allowlist_hashes.append(h)
+    ids, lengths = pack_sequences(valid_sequences)
+    for seq, h in zip(valid_sequences, calculate_context_hashes(ids, lengths).tolist()):
         print(f"    Sequence {seq} -> Hash: {hex(h)}")
 
-    # 3. Output Allow-List Binary
-    with open("allowlist.bin", "wb") as f:
-        # Write count first
-        f.write(struct.pack("Q", len(allowlist_hashes)))
-        for h in allowlist_hashes:
-            f.write(struct.pack("Q", h))
-            
-    print(f"[+] Successfully generated allowlist.bin with {len(allowlist_hashes)} entries.")
+    # 3. Output Allow-List Binary (v2 hash table, O(1) lookup in qsafe_hook)
+    count, size = write_bulk_allowlist(ids, lengths, "allowlist.bin")
+
+    print(f"[+] Successfully generated allowlist.bin with {count} entries ({size} bytes).")
 
 if __name__ == "__main__":
     main()
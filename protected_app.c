@@ -4,9 +4,7 @@
 #include <stdint.h>
 #include <unistd.h>
 
-// --- Q-SAFE INSTRUMENTATION ---
-extern void qsafe_init(uint64_t* list, uint64_t size);
-extern void qsafe_hook(uint64_t target_id);
+#include "qsafe_allowlist.h"
 
 // Function IDs for Context Hashing
 #define ID_MAIN       0x1111
@@ -14,20 +12,15 @@ extern void qsafe_hook(uint64_t target_id);
 #define ID_ADMIN      0x9999   // The "Forbidden" function (if reached via overflow)
 
 // Global Allowlist (In a real scenario, this is loaded securely)
-uint64_t* allowlist = NULL;
-uint64_t allowlist_count = 0;
+long allowlist_count = 0;
 
 void load_allowlist() {
-    FILE* f = fopen("allowlist.bin", "rb");
-    if (!f) {
+    allowlist_count = qsafe_load_allowlist("allowlist.bin");
+    if (allowlist_count < 0) {
         printf("[-] Q-SAFE ERROR: allowlist.bin not found. Run neural_oracle.py first!\n");
          // For demo purposes, we might run without it but it will fail all checks.
         exit(1);
     }
-    fread(&allowlist_count, sizeof(uint64_t), 1, f);
-    allowlist = (uint64_t*)malloc(allowlist_count * sizeof(uint64_t));
-    fread(allowlist, sizeof(uint64_t), allowlist_count, f);
-    fclose(f);
 }
 
 // --- VULNERABLE APPLICATION LOGIC ---
@@ -75,7 +68,6 @@ void process_input(char* filename) {
 int main(int argc, char* argv[]) {
     // 1. Initialize Q-SAFE Protection Layer
     load_allowlist();
-    qsafe_init(allowlist, allowlist_count);
     
     // [HOOK] Program Start
     qsafe_hook(ID_MAIN);
@@ -0,0 +1,130 @@
+// Q-SAFE allowlist loader (shared by qsafe_driver.c, protected_app.c, bench_hook.c)
+// Maps allowlist.bin read-only and arms the assembly monitor on the mapping.
+//   v2 ("QSAL" header + open-addressed table) -> qsafe_init_table  (O(1) hook)
+//   v1 (u64 count + u64 array)                -> qsafe_init        (O(N) hook)
+// Nothing is copied: every protected process shares the file's page-cache
+// pages, and startup only checks the header, whatever the table size.
+// Layout must match allowlist.py EXACTLY.
+
+#ifndef QSAFE_ALLOWLIST_H
+#define QSAFE_ALLOWLIST_H
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#define QSAFE_AL_MAGIC         "QSAL"
+#define QSAFE_AL_VERSION       2
+#define QSAFE_AL_FLAG_HAS_ZERO 0x1
+
+typedef struct {
+    char     magic[4];
+    uint16_t version;
+    uint16_t flags;
+    uint64_t count;
+    uint64_t capacity;
+    uint32_t shift;
+    uint32_t load_permille;
+} qsafe_allowlist_header;   // 32 bytes, little-endian
+
+// --- Q-SAFE INSTRUMENTATION (qsafe_monitor.asm) ---
+extern void qsafe_init(uint64_t* list, uint64_t size);
+extern void qsafe_init_table(uint64_t* slots, uint64_t capacity, uint64_t flags);
+extern void qsafe_hook(uint64_t target_id);
+
+typedef struct {
+    int       legacy;     // 1: v1 list (data = hashes), 0: v2 table (data = slots)
+    uint64_t* data;       // points into the mapping
+    uint64_t  count;
+    uint64_t  capacity;
+    uint64_t  flags;
+    void*     map;
+    size_t    map_size;
+} qsafe_allowlist;
+
+// Maps and validates path into al. Returns 0, or -1 on error.
+static inline int qsafe_read_allowlist(const char* path, qsafe_allowlist* al) {
+    memset(al, 0, sizeof(*al));
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) {
+        return -1;
+    }
+    struct stat st;
+    if (fstat(fd, &st) < 0 || (size_t)st.st_size < sizeof(uint64_t)) {
+        printf("[-] Q-SAFE ERROR: %s is truncated.\n", path);
+        close(fd);
+        return -1;
+    }
+    size_t size = (size_t)st.st_size;
+    void* map = mmap(NULL, size, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (map == MAP_FAILED) {
+        return -1;
+    }
+    al->map = map;
+    al->map_size = size;
+
+    const qsafe_allowlist_header* hdr = (const qsafe_allowlist_header*)map;
+    if (size < sizeof(*hdr) || memcmp(hdr->magic, QSAFE_AL_MAGIC, 4) != 0) {
+        // Legacy v1: count followed by the hashes
+        al->legacy = 1;
+        al->count = *(const uint64_t*)map;
+        al->capacity = al->count;
+        al->data = (uint64_t*)map + 1;
+        if (al->count > (size - sizeof(uint64_t)) / sizeof(uint64_t)) {
+            printf("[-] Q-SAFE ERROR: %s is truncated.\n", path);
+            goto fail;
+        }
+        return 0;
+    }
+
+    if (hdr->version != QSAFE_AL_VERSION ||
+        hdr->capacity < 2 || (hdr->capacity & (hdr->capacity - 1)) ||
+        hdr->count >= hdr->capacity || hdr->shift != 64 - (uint32_t)__builtin_ctzll(hdr->capacity)) {
+        printf("[-] Q-SAFE ERROR: %s has an invalid or unsupported header.\n", path);
+        goto fail;
+    }
+    if (hdr->capacity > (size - sizeof(*hdr)) / sizeof(uint64_t)) {
+        printf("[-] Q-SAFE ERROR: %s is truncated.\n", path);
+        goto fail;
+    }
+
+    al->count = hdr->count;
+    al->capacity = hdr->capacity;
+    al->flags = hdr->flags;
+    al->data = (uint64_t*)((char*)map + sizeof(*hdr));
+    madvise(map, size, MADV_RANDOM);   // hash probes: no readahead
+    return 0;
+
+fail:
+    munmap(map, size);
+    memset(al, 0, sizeof(*al));
+    return -1;
+}
+
+// Hands the allowlist to the monitor (also resets the rolling context).
+static inline void qsafe_arm_allowlist(const qsafe_allowlist* al) {
+    if (al->legacy) {
+        qsafe_init(al->data, al->count);
+    } else {
+        qsafe_init_table(al->data, al->capacity, al->flags);
+    }
+}
+
+// Loads path and initializes the monitor.
+// Returns the number of allowed hashes, or -1 on error.
+static inline long qsafe_load_allowlist(const char* path) {
+    static qsafe_allowlist al;
+    if (qsafe_read_allowlist(path, &al) < 0) {
+        return -1;
+    }
+    qsafe_arm_allowlist(&al);
+    return (long)al.count;
+}
+
+#endif
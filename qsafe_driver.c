@@ -10,32 +10,20 @@
 #define FUNC_B    0x4000
 #define FUNC_VIOLATION 0xDEAD
 
-// External Assembly Functions
-extern void qsafe_init(uint64_t* list, uint64_t size);
-extern void qsafe_hook(uint64_t target_id);
+// External Assembly Functions + allowlist loader
+#include "qsafe_allowlist.h"
 
-// Global Allowlist Buffer
-uint64_t* allowlist = NULL;
-uint64_t allowlist_count = 0;
+long allowlist_count = 0;
 
 void load_allowlist() {
-    FILE* f = fopen("allowlist.bin", "rb");
-    if (!f) {
-        perror("[-] Failed to open allowlist.bin");
+    // v2 hash table (O(1) hook) or legacy list; arms the monitor
+    allowlist_count = qsafe_load_allowlist("allowlist.bin");
+    if (allowlist_count < 0) {
+        perror("[-] Failed to load allowlist.bin");
         exit(1);
     }
-    
-    // Read count
-    fread(&allowlist_count, sizeof(uint64_t), 1, f);
-    
-    // Allocate memory
-    allowlist = (uint64_t*)malloc(allowlist_count * sizeof(uint64_t));
-    
-    // Read hashes
-    fread(allowlist, sizeof(uint64_t), allowlist_count, f);
-    fclose(f);
-    
-    printf("[+] Loaded %lu valid context hashes.\n", allowlist_count);
+
+    printf("[+] Loaded %ld valid context hashes.\n", allowlist_count);
 }
 
 // ---------------------------------------------------------
@@ -85,11 +73,9 @@ void rop_attack_simulation() {
 int main(int argc, char* argv[]) {
     printf("=== Q-SAFE Runtime Enforcement POC ===\n");
     
+    // Load allowlist + Initialize Monitor
     load_allowlist();
     
-    // Initialize Monitor
-    qsafe_init(allowlist, allowlist_count);
-    
     // Initial Hook for Main
     qsafe_hook(FUNC_MAIN);
     
@@ -13,9 +13,19 @@ section .bss
     allowlist_ptr   resq 1      ; Pointer to the allowlist array
     allowlist_size  resq 1      ; Number of entries in allowlist
 
+    ; v2 hash table (allowlist.bin "QSAL"), see allowlist.py for the layout
+    table_ptr       resq 1      ; Slot array (0 = empty), NULL in legacy mode
+    table_mask      resq 1      ; capacity - 1
+    table_shift     resq 1      ; 64 - log2(capacity)
+    table_has_zero  resq 1      ; Hash 0 is allowed (cannot be stored in a slot)
+
 section .text
     global qsafe_init
+    global qsafe_init_table
     global qsafe_hook
+
+%define QSAFE_GOLDEN 0x9E3779B97F4A7C15 ; Fibonacci hashing multiplier
+%define QSAFE_FLAG_HAS_ZERO 1
     
     extern printf
     extern exit
@@ -29,6 +39,7 @@ section .text
 qsafe_init:
     mov [allowlist_ptr], rdi
     mov [allowlist_size], rsi
+    mov qword [table_ptr], 0        ; Legacy linear mode
     mov qword [current_context], 0  ; Reset context
     
     ; Debug print (optional, can be removed for zero-overhead)
@@ -37,6 +48,26 @@ qsafe_init:
     
     ret
 
+; -----------------------------------------------------------------------------
+; void qsafe_init_table(uint64_t* slots, uint64_t capacity, uint64_t flags)
+; Initializes the monitor with a v2 open-addressed table (header already
+; validated by the loader). capacity must be a power of two, load < 1.
+; Data passed in RDI (slots), RSI (capacity), RDX (flags)
+; -----------------------------------------------------------------------------
+qsafe_init_table:
+    mov [table_ptr], rdi
+    lea rax, [rsi - 1]
+    mov [table_mask], rax
+    bsr rcx, rsi                    ; log2(capacity)
+    mov rax, 64
+    sub rax, rcx
+    mov [table_shift], rax
+    and rdx, QSAFE_FLAG_HAS_ZERO
+    mov [table_has_zero], rdx
+    mov qword [allowlist_size], 0
+    mov qword [current_context], 0  ; Reset context
+    ret
+
 ; -----------------------------------------------------------------------------
 ; void qsafe_hook(uint64_t target_id)
 ; Called at critical branch points.
@@ -47,6 +78,8 @@ qsafe_hook:
     push rbx
     push rcx
     push rdx
+    push rsi
+    push rax
     
     ; 1. LOAD CONTEXT
     mov rbx, [current_context]
@@ -59,9 +92,12 @@ qsafe_hook:
     ; Save new context
     mov [current_context], rbx
     
-    ; 3. VERIFY CONTEXT via Linear Scan (O(N) - Simplified for POC)
-    ; In production, this would be a constant time Bloom Filter lookup or HashMap.
-    
+    ; 3. VERIFY CONTEXT
+    mov rdx, [table_ptr]
+    test rdx, rdx
+    jnz .table_lookup
+
+    ; Legacy list: Linear Scan (O(N))
     mov rcx, [allowlist_size]
     mov rdx, [allowlist_ptr]
     
@@ -76,8 +112,35 @@ qsafe_hook:
     dec rcx
     jmp .scan_loop
 
+    ; v2 table: O(1) expected, slot = (hash * GOLDEN) >> shift, linear probing
+.table_lookup:
+    test rbx, rbx
+    jz .zero_hash                   ; 0 marks empty slots, tracked by a flag
+
+    mov rax, QSAFE_GOLDEN
+    imul rax, rbx                   ; low 64 bits of hash * GOLDEN
+    mov rcx, [table_shift]
+    shr rax, cl
+    mov rsi, [table_mask]
+
+.probe_loop:
+    mov rcx, [rdx + rax*8]
+    cmp rcx, rbx
+    je .valid
+    test rcx, rcx
+    jz .violation                   ; Empty slot -> not in allowlist
+    inc rax
+    and rax, rsi
+    jmp .probe_loop
+
+.zero_hash:
+    cmp qword [table_has_zero], 0
+    je .violation
+
 .valid:
     ; Context is valid, restore regs and return
+    pop rax
+    pop rsi
     pop rdx
     pop rcx
     pop rbx
@@ -2,7 +2,7 @@
 
 # Setup
 if [ -f .env ]; then export $(cat .env | xargs); fi
-rm -f guardian guardian.o scan_list.txt suspicious_targets.txt
+rm -f guardian guardian.o scan_list.txt suspicious_targets.txt scan_list.qsl suspicious_targets.qsl
 
 # Build
 nasm -f elf64 guardian.asm -o guardian.o
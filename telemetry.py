@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+# Pipeline telemetry store.
+# discovery.py, agent_triage.py and deep_scan.py append structured events
+# (files discovered, zones triaged, verdicts, per-stage latencies) to one
+# SQLite file in WAL mode; the dashboard tails it by row id, so each poll
+# reads only rows it has not seen. QSAFE_TELEMETRY_DB sets the database
+# path; QSAFE_TELEMETRY=off (or 0/false/no) disables recording.
+
+TELEMETRY_FILE = os.getenv("QSAFE_TELEMETRY_DB", "telemetry.db")
+MAX_ROWS = 200000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts     REAL NOT NULL,
+    source TEXT NOT NULL,
+    kind   TEXT NOT NULL,
+    name   TEXT,
+    value  REAL,
+    data   TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+"""
+
+def enabled():
+    # Read on every call, so the switch can be flipped at run time
+    return os.getenv("QSAFE_TELEMETRY", "on").strip().lower() not in ("", "0", "off", "false", "no")
+
+class TelemetryStore:
+    """
+    Append-only event log, capped at max_rows (oldest rows are pruned).
+    One connection per thread, like VerdictCache.
+    """
+
+    def __init__(self, path=TELEMETRY_FILE, max_rows=MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.pid = os.getpid()
+        self._writes = 0
+        self._local = threading.local()
+        self._db().executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def emit_many(self, events):
+        # events: iterable of (source, kind, name, value, data dict or None)
+        now = time.time()
+        rows = [(now, source, kind, name, value, json.dumps(data) if data else None)
+                for source, kind, name, value, data in events]
+        if not rows:
+            return
+        db = self._db()
+        with db:
+            db.executemany("INSERT INTO events (ts, source, kind, name, value, data) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        # Pruning is amortized over writes
+        self._writes += len(rows)
+        if self._writes >= 256:
+            self._writes = 0
+            self.prune()
+
+    def emit(self, source, kind, name=None, value=None, **data):
+        self.emit_many([(source, kind, name, value, data)])
+
+    def prune(self):
+        db = self._db()
+        (last,) = db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()
+        return db.execute("DELETE FROM events WHERE id <= ?", (last - self.max_rows,)).rowcount
+
+    def first_id_since(self, ts):
+        # Cursor for "everything from ts on" (uses the ts index)
+        row = self._db().execute("SELECT MIN(id) FROM events WHERE ts >= ?", (ts,)).fetchone()
+        if row[0] is not None:
+            return row[0] - 1
+        return self.last_id()
+
+    def last_id(self):
+        return self._db().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def after(self, cursor, limit=5000):
+        """
+        Rows with id > cursor, oldest first, as dicts. Ids follow commit
+        order, so unlike raw timestamps from several writer processes the
+        cursor never skips a late commit.
+        """
+        rows = self._db().execute("SELECT id, ts, source, kind, name, value, data FROM events "
+                                  "WHERE id > ? ORDER BY id LIMIT ?", (cursor, limit)).fetchall()
+        return [{"id": i, "ts": ts, "source": source, "kind": kind, "name": name, "value": value,
+                 "data": json.loads(data) if data else {}}
+                for i, ts, source, kind, name, value, data in rows]
+
+# --- Process-wide store for the pipeline stages ---
+# Telemetry must never break a scan: any storage error disables it for the
+# rest of the process.
+
+_store = None
+_store_lock = threading.Lock()
+_failed = False
+
+def store():
+    global _store, _failed
+    if _failed or not enabled():
+        return None
+    with _store_lock:
+        # A forked worker must not reuse the parent's connection
+        if _store is None or _store.pid != os.getpid():
+            try:
+                _store = TelemetryStore()
+            except sqlite3.Error:
+                _failed = True
+                return None
+    return _store
+
+def emit_many(events):
+    global _failed
+    s = store()
+    if s is None:
+        return
+    try:
+        s.emit_many(events)
+    except sqlite3.Error:
+        _failed = True
+
+def emit(source, kind, name=None, value=None, **data):
+    emit_many([(source, kind, name, value, data)])
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE pipeline telemetry")
+    parser.add_argument("--db", default=TELEMETRY_FILE)
+    parser.add_argument("-n", type=int, default=20, help="show the last N events")
+    parser.add_argument("--follow", action="store_true", help="keep printing new events")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"[-] No telemetry at {args.db}")
+        sys.exit(1)
+    st = TelemetryStore(args.db)
+    cursor = max(0, st.last_id() - args.n)
+    while True:
+        for e in st.after(cursor):
+            cursor = e["id"]
+            when = time.strftime("%H:%M:%S", time.localtime(e["ts"]))
+            value = "" if e["value"] is None else f" {e['value']:g}"
+            print(f"    {when}  {e['source']:<10} {e['kind']:<10} {e['name'] or ''}{value}  {e['data'] or ''}")
+        if not args.follow:
+            break
+        time.sleep(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+# Persistent LLM verdict cache.
+# Key = content digest (BLAKE2b) + model + prompt version, so an identical file
+# seen on another run (or another host sharing the DB) never costs a second
+# remote call. SQLite in WAL mode keeps it safe for the deep-scan worker pool.
+
+CACHE_FILE = "verdict_cache.db"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    digest         TEXT NOT NULL,
+    model          TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    verdict        TEXT NOT NULL,
+    created        REAL NOT NULL,
+    last_used      REAL NOT NULL,
+    hits           INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (digest, model, prompt_version)
+);
+CREATE INDEX IF NOT EXISTS verdicts_lru ON verdicts (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def content_digest(data):
+    # BLAKE2b over any buffer (bytes, memoryview over an mmap) without copying
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+def prompt_version(*parts):
+    # Short fingerprint of everything that shapes the remote answer
+    return hashlib.sha256("\x00".join(str(p) for p in parts).encode()).hexdigest()[:12]
+
+class VerdictCache:
+    """
+    SQLite-backed verdict cache with TTL expiry and LRU eviction.
+    One connection per thread; processes each open their own instance.
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._local = threading.local()
+        self._db().executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, db, name):
+        db.execute("INSERT INTO counters (name, value) VALUES (?, 1) "
+                   "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, digest, model, version):
+        # Cached verdict string, or None on miss/expiry
+        db = self._db()
+        now = time.time()
+        row = db.execute("SELECT verdict, created FROM verdicts WHERE digest=? AND model=? AND prompt_version=?",
+                         (digest, model, version)).fetchone()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            self.misses += 1
+            self._count(db, "misses")
+            return None
+
+        db.execute("UPDATE verdicts SET last_used=?, hits=hits+1 WHERE digest=? AND model=? AND prompt_version=?",
+                   (now, digest, model, version))
+        self.hits += 1
+        self._count(db, "hits")
+        return row[0]
+
+    def put(self, digest, model, version, verdict):
+        db = self._db()
+        now = time.time()
+        db.execute("INSERT OR REPLACE INTO verdicts (digest, model, prompt_version, verdict, created, last_used) "
+                   "VALUES (?, ?, ?, ?, ?, ?)", (digest, model, version, verdict, now, now))
+        # Eviction scans the table, so it is amortized over puts
+        self._puts += 1
+        if self._puts % 64 == 1:
+            self.evict()
+
+    def evict(self):
+        # Drop expired rows, then least-recently-used rows above max_entries
+        db = self._db()
+        removed = 0
+        if self.ttl:
+            removed += db.execute("DELETE FROM verdicts WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        if self.max_entries:
+            (n,) = db.execute("SELECT COUNT(*) FROM verdicts").fetchone()
+            if n > self.max_entries:
+                removed += db.execute("DELETE FROM verdicts WHERE rowid IN "
+                                      "(SELECT rowid FROM verdicts ORDER BY last_used LIMIT ?)",
+                                      (n - self.max_entries,)).rowcount
+        return removed
+
+    def purge(self, model=None):
+        db = self._db()
+        if model:
+            return db.execute("DELETE FROM verdicts WHERE model=?", (model,)).rowcount
+        n = db.execute("DELETE FROM verdicts").rowcount
+        db.execute("DELETE FROM counters")
+        return n
+
+    def stats(self):
+        db = self._db()
+        counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        (entries,) = db.execute("SELECT COUNT(*) FROM verdicts").fetchone()
+        by_verdict = dict(db.execute("SELECT verdict, COUNT(*) FROM verdicts GROUP BY verdict").fetchall())
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "by_verdict": by_verdict,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def entries(self, limit=20):
+        return self._db().execute("SELECT digest, model, prompt_version, verdict, created, last_used, hits "
+                                  "FROM verdicts ORDER BY last_used DESC LIMIT ?", (limit,)).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE verdict cache")
+    parser.add_argument("--cache", default=CACHE_FILE)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    p_list = sub.add_parser("list")
+    p_list.add_argument("-n", type=int, default=20)
+    p_purge = sub.add_parser("purge")
+    p_purge.add_argument("--model", default=None, help="only purge this model's verdicts")
+    p_purge.add_argument("--expired", action="store_true", help="only TTL/LRU eviction")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache):
+        print(f"[-] No verdict cache at {args.cache}")
+        sys.exit(1)
+    cache = VerdictCache(args.cache)
+
+    if args.cmd == "stats":
+        s = cache.stats()
+        print(f"[*] VERDICT CACHE: {s['entries']} entries {s['by_verdict']}")
+        print(f"    hits: {s['hits']}  misses: {s['misses']}  hit rate: {s['hit_rate']:.1%}")
+    elif args.cmd == "list":
+        for digest, model, version, verdict, created, last_used, hits in cache.entries(args.n):
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used))
+            print(f"    {digest[:16]}  {verdict:<6}  {model}  v{version}  hits={hits}  last={used}")
+    elif args.expired:
+        print(f"[*] VERDICT CACHE: evicted {cache.evict()} entries.")
+    else:
+        print(f"[*] VERDICT CACHE: purged {cache.purge(args.model)} entries.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import os
+import sys
+import json
+import time
+import errno
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from signature_engine import SignatureEngine, RULES_FILE
+from verdict_cache import VerdictCache, CACHE_FILE
+from discovery import SCAN_EXTS
+import agent_triage
+import deep_scan
+import metrics
+import telemetry
+
+# Continuous watch mode.
+# 1. Subscribe (inotify) to every directory under the high-risk zones that
+#    agent_triage.py wrote to high_risk_zones.txt.
+# 2. Coalesce bursts of events per file: a file is scanned once it has been
+#    quiet for --debounce seconds, or --max-delay after its first event.
+# 3. Push only the touched files through deep_scan.analyze() (same tiers,
+#    signatures and remote verdict cache as --batch).
+# 4. Append verdicts to watch_report.jsonl and UNSAFE paths to the
+#    watch_unsafe.txt queue; the next deep_scan.py --batch moves them into
+#    unsafe_targets.txt for guardian's review step.
+# The loop sleeps in poll() until an event or the next debounce deadline,
+# so an idle watcher uses no CPU. When high_risk_zones.txt is rewritten (a
+# new triage run), the watch set follows it.
+
+WATCH_REPORT = "watch_report.jsonl"
+DEBOUNCE = 0.5
+MAX_DELAY = 5.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_MASK_ADD = 0x20000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len (name follows)
+
+class Inotify:
+    """
+    Minimal inotify binding over libc (ctypes, no extra dependency).
+    Watches are per directory; read() returns (path, mask) for each event.
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.dirs = {}   # wd -> directory path
+        self.wds = {}    # directory path -> wd
+
+    def fileno(self):
+        return self.fd
+
+    def add(self, path, mask=WATCH_MASK):
+        # Returns the watch descriptor, or -1 (vanished, permission, watch limit).
+        # Masks accumulate, so watching a directory twice never narrows it.
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask | IN_MASK_ADD)
+        if wd < 0:
+            if ctypes.get_errno() == errno.ENOSPC:
+                print(f"[-] WATCH: inotify watch limit reached at {path} (raise fs.inotify.max_user_watches)")
+            return -1
+        self.dirs[wd] = path
+        self.wds[path] = wd
+        return wd
+
+    def add_tree(self, root):
+        # Watches root and every directory below it (symlinks not followed)
+        added = 0
+        for d, subdirs, _ in os.walk(root):
+            if self.add(d) < 0:
+                subdirs[:] = []
+                continue
+            added += 1
+        return added
+
+    def remove_tree(self, root, keep=()):
+        # Drops the watches under root, except those still under a zone in keep
+        prefix = root.rstrip("/") + "/"
+        for path in [p for p in self.wds if p == root or p.startswith(prefix)]:
+            if any(path == k or path.startswith(k.rstrip("/") + "/") for k in keep):
+                continue
+            self._libc.inotify_rm_watch(self.fd, self.wds.pop(path))
+
+    def read(self):
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            off = 0
+            while off < len(buf):
+                wd, mask, _, n = _EVENT.unpack_from(buf, off)
+                off += _EVENT.size
+                name = buf[off:off + n].rstrip(b"\0")
+                off += n
+                if mask & IN_Q_OVERFLOW:
+                    events.append((None, mask))
+                    continue
+                d = self.dirs.get(wd)
+                if mask & IN_IGNORED:
+                    if d is not None and self.wds.get(d) == wd:
+                        del self.wds[d]
+                    self.dirs.pop(wd, None)
+                    continue
+                if d is not None:
+                    events.append((os.path.join(d, os.fsdecode(name)) if name else d, mask))
+
+    def close(self):
+        os.close(self.fd)
+
+class Debouncer:
+    """
+    Pending paths keyed by path: (first event, last event). A path is due
+    once quiet for `quiet` seconds, or `max_delay` after its first event
+    so a file that never stops changing is still scanned.
+    """
+
+    def __init__(self, quiet=DEBOUNCE, max_delay=MAX_DELAY):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.pending = {}
+
+    def touch(self, path, now):
+        first, _ = self.pending.get(path, (now, now))
+        self.pending[path] = (first, now)
+
+    def _deadline(self, first, last):
+        return min(last + self.quiet, first + self.max_delay)
+
+    def due(self, now):
+        # Due paths with their first-event time, oldest first
+        ready = sorted((first, p) for p, (first, last) in self.pending.items() if self._deadline(first, last) <= now)
+        for _, p in ready:
+            del self.pending[p]
+        return [(p, first) for first, p in ready]
+
+    def timeout(self, now):
+        # Seconds until the next path is due (None: nothing pending)
+        if not self.pending:
+            return None
+        return max(0.0, min(self._deadline(f, l) for f, l in self.pending.values()) - now)
+
+def load_zones(path=agent_triage.ZONES_FILE):
+    try:
+        with open(path, "r", errors="ignore") as f:
+            return sorted({os.path.abspath(line.strip()) for line in f if line.strip()})
+    except OSError:
+        return []
+
+def wanted(path, all_files=False):
+    return all_files or path.endswith(SCAN_EXTS)
+
+def sync_zones(ino, zones, watched):
+    # Brings the watch set in line with zones; returns the newly added zones.
+    # Zones may nest, so a released zone keeps the watches another zone covers.
+    remaining = [z for z in zones if os.path.isdir(z)]
+    for z in watched - set(zones):
+        ino.remove_tree(z, remaining)
+        print(f"[*] WATCH: released {z}")
+    added = []
+    for z in zones:
+        if z not in watched and os.path.isdir(z):
+            print(f"[*] WATCH: {z} ({ino.add_tree(z)} directories)")
+            added.append(z)
+    watched.clear()
+    watched.update(remaining)
+    return added
+
+def in_zones(path, zones):
+    # True if path lies below one of zones (at any depth)
+    d = os.path.dirname(path)
+    while d not in zones:
+        parent = os.path.dirname(d)
+        if parent == d:
+            return False
+        d = parent
+    return True
+
+def files_below(root, all_files=False):
+    for d, _, files in os.walk(root):
+        for name in files:
+            p = os.path.join(d, name)
+            if wanted(p, all_files):
+                yield p
+
+def watch(zones, zones_file=None, rules_file=RULES_FILE, remote=True, cache_file=CACHE_FILE,
+          report=WATCH_REPORT, unsafe_list=deep_scan.WATCH_QUEUE, workers=4, quiet=DEBOUNCE,
+          max_delay=MAX_DELAY, all_files=False):
+    """
+    Runs until interrupted. zones is the initial list of directories; with
+    zones_file, the list is re-read whenever that file is rewritten.
+    Returns {verdict: count} for the session.
+    """
+    engine = SignatureEngine.from_rules(rules_file)
+    use_cache = remote and cache_file and agent_triage.llm_available()
+    cache = VerdictCache(cache_file) if use_cache else None
+    ino = Inotify()
+    pending = Debouncer(quiet, max_delay)
+    counts = {"SAFE": 0, "UNSAFE": 0, "ERROR": 0}
+    own = {os.path.abspath(report), os.path.abspath(unsafe_list), os.path.abspath(unsafe_list + ".lock")}
+
+    zones_path = os.path.abspath(zones_file) if zones_file else None
+
+    def follow_zones_file():
+        # The zones file is rewritten by each triage run; watch its directory.
+        # Other events from that directory count only if it lies in a zone.
+        if zones_path:
+            ino.add(os.path.dirname(zones_path), IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR)
+
+    watched = set()
+    sync_zones(ino, zones, watched)
+    follow_zones_file()
+    if not watched:
+        print("[!] WATCH: no high-risk zones yet; waiting for triage output.")
+
+    poller = select.poll()
+    poller.register(ino.fileno(), select.POLLIN)
+
+    with ThreadPoolExecutor(max_workers=workers) as ex, \
+         open(report, "a", buffering=1) as rep:
+        try:
+            while True:
+                timeout = pending.timeout(time.monotonic())
+                if poller.poll(None if timeout is None else max(1, int(timeout * 1000) + 1)):
+                    now = time.monotonic()
+                    for path, mask in ino.read():
+                        if path is None:
+                            # Kernel queue overflowed: events were lost, rescan the zones
+                            print("[!] WATCH: event queue overflow, rescanning zones.")
+                            metrics.count("watch.overflows")
+                            for z in watched:
+                                for p in files_below(z, all_files):
+                                    pending.touch(p, now)
+                            continue
+                        if path == zones_path:
+                            for z in sync_zones(ino, load_zones(zones_path), watched):
+                                for p in files_below(z, all_files):
+                                    pending.touch(p, now)
+                            follow_zones_file()
+                            continue
+                        if mask & IN_ISDIR:
+                            if mask & (IN_CREATE | IN_MOVED_TO) and in_zones(path, watched):
+                                # New subtree: watch it and pick up files written before the watch existed
+                                ino.add_tree(path)
+                                for p in files_below(path, all_files):
+                                    pending.touch(p, now)
+                            continue
+                        if mask & (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) \
+                                and wanted(path, all_files) and path not in own and in_zones(path, watched):
+                            pending.touch(path, now)
+                            metrics.count("watch.events")
+
+                due = pending.due(time.monotonic())
+                if not due:
+                    continue
+                paths = [p for p, _ in due if os.path.isfile(p)]
+                first = dict(due)
+                events = []
+                with metrics.timer("watch.batch"):
+                    results = ex.map(lambda p: deep_scan.analyze(p, engine, remote, cache), paths)
+                    for result in results:
+                        latency = time.monotonic() - first[result["path"]]
+                        metrics.observe("watch.latency", latency)
+                        counts[result["verdict"]] += 1
+                        rep.write(json.dumps(dict(result, latency=round(latency, 3))) + "\n")
+                        if result["verdict"] == "UNSAFE":
+                            deep_scan.queue_unsafe(result["path"], unsafe_list)
+                            print(f"    [!] {result['path']}: {result.get('rule') or result['reason']} "
+                                  f"({latency:.2f}s after write)")
+                        events.append(("watch", "verdict", result["verdict"], latency,
+                                       {"path": result["path"], "reason": result["reason"],
+                                        "tier": result["tier"], "rule": result.get("rule")}))
+                telemetry.emit_many(events)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ino.close()
+    return counts
+
+def self_test():
+    """
+    Nested zones on a scratch tree: releasing the outer or the inner zone
+    must keep the other one's watches live. Returns True if every check passed.
+    """
+    import tempfile
+    checks = []
+    with tempfile.TemporaryDirectory() as root:
+        outer = os.path.join(root, "a")
+        inner = os.path.join(outer, "b")
+        os.makedirs(inner)
+        for name, first, then in (("release outer", [outer, inner], [inner]),
+                                  ("release inner", [outer, inner], [outer])):
+            ino = Inotify()
+            try:
+                watched = set()
+                sync_zones(ino, first, watched)
+                sync_zones(ino, then, watched)
+                target = os.path.join(inner, name.replace(" ", "_") + ".sh")
+                with open(target, "w") as f:
+                    f.write("echo\n")
+                select.select([ino], [], [], 1.0)
+                seen = any(path == target for path, _ in ino.read())
+                checks.append((name, inner in ino.wds and (outer in ino.wds) == (outer in then) and seen))
+            finally:
+                ino.close()
+    for name, ok in checks:
+        print(f"    [{'+' if ok else '-'}] {name}")
+    return all(ok for _, ok in checks)
+
+def _stop(*_):
+    # SIGTERM (service stop) ends the session like Ctrl-C; repeats are ignored
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE continuous watch of high-risk zones")
+    parser.add_argument("zones", nargs="*", help="directories to watch (default: the triage output)")
+    parser.add_argument("--zones-file", default=agent_triage.ZONES_FILE,
+                        help="high-risk zones from agent_triage.py, re-read when rewritten")
+    parser.add_argument("-r", "--rules", default=RULES_FILE)
+    parser.add_argument("--no-remote", action="store_true", help="signatures only, never call the LLM")
+    parser.add_argument("--cache", default=CACHE_FILE, help="persistent LLM verdict cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--report", default=WATCH_REPORT)
+    parser.add_argument("--unsafe-list", default=deep_scan.WATCH_QUEUE,
+                        help="review queue, merged into unsafe_targets.txt by the next batch scan")
+    parser.add_argument("-j", "--workers", type=int, default=4)
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE, help="quiet period before a file is scanned")
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY, help="scan a busy file at least this often")
+    parser.add_argument("--all-files", action="store_true", help="not only the discovery extensions")
+    parser.add_argument("--self-test", action="store_true", help="check nested zone watches and exit")
+    args = parser.parse_args()
+
+    if args.self_test:
+        print("[*] WATCH: self-test on nested zones...")
+        ok = self_test()
+        print("[+] WATCH: all checks passed." if ok else "[-] WATCH: self-test failed.")
+        sys.exit(0 if ok else 1)
+
+    if args.zones:
+        zones, zones_file = sorted({os.path.abspath(z) for z in args.zones}), None
+    else:
+        zones, zones_file = load_zones(args.zones_file), args.zones_file
+
+    signal.signal(signal.SIGTERM, _stop)
+    metrics.start("watch")
+    print(f"[*] WATCH: debounce {args.debounce}s (max {args.max_delay}s), {args.workers} workers.")
+    try:
+        counts = watch(zones, zones_file, args.rules, not args.no_remote, None if args.no_cache else args.cache,
+                       args.report, args.unsafe_list, args.workers, args.debounce, args.max_delay, args.all_files)
+    except OSError as e:
+        print(f"[-] WATCH: inotify unavailable: {e.strerror}")
+        sys.exit(1)
+    print(f"[*] WATCH: stopped. {counts['UNSAFE']} UNSAFE, {counts['SAFE']} SAFE, {counts['ERROR']} unreadable.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import re
+import sys
+import time
+import argparse
+
+import scanlist
+
+# Compact zone lists for the LLM triage prompt.
+# Folders are sent as a compressed tree instead of one absolute path per
+# line: an indented line continues the path of the nearest line above it
+# with less indentation, and single-child chains are merged into one line,
+# so a shared prefix such as /home/user/.cache/pip is written once.
+# Every zone carries a short #N tag; the model answers with tags, and
+# decode() maps them (or verbatim paths) back to the exact input folders.
+#
+#   /
+#    etc
+#     #1 hostapd
+#      #2 wpa/certs
+#     #3 init.d
+#    #4 tmp
+
+TREE_HINT = ("Folders are listed as a tree: an indented line continues the path of the nearest "
+             "less-indented line above it. Reply ONLY with the #N tags of the folders you select, one per line.")
+TAG = re.compile(r"#(\d+)")
+LIST_MARK = re.compile(r"^(?:[-*]|\d+[.)])\s+")
+
+# cl100k-style pre-tokenizer, used when tiktoken is unavailable
+_PIECE = re.compile(r"[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+|_+")
+_encoding = None
+
+def count_tokens(text):
+    """
+    Tokens in text: exact with tiktoken (cl100k_base) when it is installed
+    and has its data, otherwise estimated from the same pre-tokenizer
+    pieces (one token per piece, plus one per extra 6 characters).
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(1 + (len(p) - 1) // 6 for p in _PIECE.findall(text))
+
+def tokenizer_name():
+    count_tokens("")
+    return "cl100k_base" if _encoding else "estimate"
+
+def zone_key(folder):
+    # Tree order: children right after their parent ("/a/b" before "/a-c")
+    return folder.rstrip("/").split("/")
+
+def encode(folders):
+    """
+    (prompt text, ids): folders as a tagged tree, with ids[n - 1] the
+    folder tagged #n. Duplicates share one tag.
+    """
+    ids = sorted(set(folders), key=zone_key)
+    root = {}
+    for n, folder in enumerate(ids, 1):
+        node = None
+        children = root
+        for part in zone_key(folder):
+            node = children.setdefault(part, [{}, []])
+            children = node[0]
+        node[1].append(n)
+
+    # Pre-order walk; untagged single-child chains collapse into one line
+    lines = []
+    stack = [(name, node, 0) for name, node in reversed(root.items())]
+    while stack:
+        name, (kids, tags), depth = stack.pop()
+        parts = [name]
+        while not tags and len(kids) == 1:
+            (name, (kids, tags)), = kids.items()
+            parts.append(name)
+        lines.append(" " * depth + "".join(f"#{n} " for n in tags) + ("/".join(parts) or "/"))
+        stack.extend((name, node, depth + 1) for name, node in reversed(kids.items()))
+    return "\n".join(lines), ids
+
+def decode(reply, ids):
+    """
+    Zones named in a model reply, in ids order: #N tags (or a bare number
+    on its own line) and verbatim folder paths, optionally list-marked. Anything else is ignored,
+    so a reply can never introduce a folder that was not asked about.
+    """
+    allowed = set(ids)
+    picked = set()
+    for line in (reply or "").split("\n"):
+        line = line.strip().strip("`")
+        path = LIST_MARK.sub("", line)
+        if path in allowed:
+            picked.add(path)
+            continue
+        tags = TAG.findall(line) or ([line] if line.isdigit() else [])
+        for t in tags:
+            n = int(t)
+            if 1 <= n <= len(ids):
+                picked.add(ids[n - 1])
+    return [f for f in ids if f in picked]
+
+def zone_cost(prev, folder):
+    # Estimated tokens folder adds to an encoded prompt after prev (tree order)
+    shared = len(os.path.commonprefix([prev, folder]))
+    shared = folder.rfind("/", 0, shared + 1) + 1
+    return count_tokens(f" #000 {folder[shared:]}") + 1
+
+def load_zones(path, files=False):
+    # Zones from a .qsl scan list, a folder list, or (files=True) a text file list
+    if scanlist.is_scan_list(path):
+        with scanlist.ScanList.load(path) as sl:
+            return list(sl.dirs)
+    paths = list(scanlist.read_paths(path))
+    return sorted(set(os.path.dirname(p) for p in paths)) if files else paths
+
+def benchmark(folders, budget):
+    import agent_triage
+    plain = "\n".join(folders)
+    t0 = time.perf_counter()
+    tree, ids = encode(folders)
+    t_enc = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    back = decode("\n".join(f"#{n}" for n in range(1, len(ids) + 1)), ids)
+    t_dec = time.perf_counter() - t0
+
+    n = len(ids) or 1
+    rows = [("paths", len(plain.encode()), count_tokens(plain), len(agent_triage.chunk_zones(folders, budget, encoded=False))),
+            ("tree", len(tree.encode()), count_tokens(tree), len(agent_triage.chunk_zones(folders, budget)))]
+    print(f"[*] ZONE PROMPT BENCH: {len(ids)} zones, tokenizer {tokenizer_name()}, budget {budget} tokens/chunk")
+    for name, size, tokens, chunks in rows:
+        print(f"    {name:<6} {size:>10,} bytes {size / n:7.1f} B/zone {tokens:>9,} tokens "
+              f"{tokens / n:6.2f} tok/zone {chunks:>5} chunks ({len(ids) / chunks if chunks else 0:,.0f} zones/chunk)")
+    (_, b0, t0_, c0), (_, b1, t1, c1) = rows
+    print(f"    {b0 / b1 if b1 else 0:.1f}x fewer bytes, {t0_ / t1 if t1 else 0:.1f}x fewer tokens, "
+          f"{c0 / c1 if c1 else 0:.1f}x fewer requests")
+    print(f"    encode {t_enc * 1000:.1f} ms, decode {t_dec * 1000:.1f} ms, round trip "
+          f"{'ok' if back == ids else 'MISMATCH'}")
+    return back == ids
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-SAFE compact zone prompts")
+    parser.add_argument("source", nargs="?", default="folder_list.txt",
+                        help="folder list, or a scan list (.qsl, or text with --files)")
+    parser.add_argument("--files", action="store_true", help="source lists files; zones are their directories")
+    parser.add_argument("--encode", action="store_true", help="print the tagged tree for the zones")
+    parser.add_argument("--decode", action="store_true", help="map a model reply on stdin back to zones")
+    parser.add_argument("--budget", type=int, default=None, help="tokens per triage chunk (bench)")
+    args = parser.parse_args()
+
+    try:
+        folders = load_zones(args.source, args.files)
+    except (OSError, ValueError) as e:
+        print(f"[-] {args.source}: {getattr(e, 'strerror', None) or e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.encode:
+        print(encode(folders)[0])
+    elif args.decode:
+        for f in decode(sys.stdin.read(), encode(folders)[1]):
+            print(f)
+    else:
+        import agent_triage
+        if not benchmark(folders, args.budget or agent_triage.CHUNK_TOKEN_BUDGET):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()